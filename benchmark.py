@@ -0,0 +1,132 @@
+#
+# Copyright 2017 Geoff Williams for Declarative Systems PTY LTD
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+import time
+from lazy_module import LazyModule
+
+docker = LazyModule("docker", "docker.errors")
+
+
+class Benchmark:
+    """
+    Benchmark
+
+    Drive the Controller from nothing to a provisioned agent `runs` times,
+    one phase at a time so each can be timed on its own: remove the old
+    containers and pick images, start the master, start the agent, wait
+    for PE to be ready, provision the agent, sign its cert and do the
+    first puppet run.  Images must already be local, nothing is pulled.
+    Each run is added to `results` as it finishes
+    """
+
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, controller, results, runs=1, label=None):
+        self.controller = controller
+        self.results = results
+        self.runs = runs
+        self.label = label
+
+        # runs started together are compared as one
+        self.batch = time.time()
+
+    def docker_init(self):
+        """remove the containers of the last run and pick images, as if starting fresh"""
+        for container_key in ["master"] + self.controller.agents():
+            container = self.controller.container[container_key]
+            try:
+                self.controller.ll_cli.remove_container(container["name"], force=True)
+            except docker.errors.NotFound:
+                pass
+            container["instance"] = None
+            container["urls"] = {}
+
+        # forget the old master was ready
+        self.controller.pe_status_prober.reset()
+        self.controller.select_images()
+        self.controller.choose_snapshots()
+        return True
+
+    def agent_provision(self):
+        agent = self.controller.container["agent"]
+        return agent["from_snapshot"] or self.controller.agent_provision() == 0
+
+    def sign_cert(self):
+        agent = self.controller.container["agent"]
+        return self.controller.sign_agent_certs([] if agent["from_snapshot"] else [agent["host"]])
+
+    def first_run(self):
+        return self.controller.run_puppet(self.controller.container["agent"]) in (0, 2)
+
+    def phases(self):
+        """(phase, function returning True on success) in the order they run"""
+        return [
+            ("docker_init", self.docker_init),
+            ("start_pe", self.controller.start_pe),
+            ("start_agent", self.controller.start_agent),
+            ("pe_ready", self.controller.wait_pe_ready),
+            ("agent_provision", self.agent_provision),
+            ("sign_cert", self.sign_cert),
+            ("first_run", self.first_run),
+        ]
+
+    def run_once(self, number):
+        """time one run through every phase, stopping at the first that fails"""
+        result = {
+            "batch": self.batch,
+            "label": self.label,
+            "run": number,
+            "time": time.time(),
+            "profile": self.controller.resource_profile(),
+        }
+        started = time.time()
+        for phase, func in self.phases():
+            if not self.controller.running:
+                result["failed_phase"] = phase
+                break
+
+            phase_started = time.time()
+            try:
+                ok = func()
+            except Exception as e:
+                self.logger.exception(e)
+                ok = False
+            result[phase] = time.time() - phase_started
+            self.logger.info("benchmark run {number}: {phase} took {elapsed:.1f}s".format(
+                number=number, phase=phase, elapsed=result[phase]))
+            if not ok:
+                self.logger.error("benchmark run {number} failed at {phase}".format(number=number, phase=phase))
+                result["failed_phase"] = phase
+                break
+
+        result["total"] = time.time() - started
+        result["ok"] = "failed_phase" not in result
+        result["master_image"] = self.controller.master_image or self.controller.settings.master_selected_image
+        result["agent_image"] = self.controller.agent_image or self.controller.settings.agent_selected_image
+        result["from_snapshot"] = self.controller.container["master"]["from_snapshot"]
+        return result
+
+    def run(self):
+        """Do all the runs, returns True if they all got to the end"""
+        ok = True
+        for number in range(1, self.runs + 1):
+            if not self.controller.running:
+                ok = False
+                break
+            result = self.run_once(number)
+            self.results.add(result)
+            ok = ok and result["ok"]
+        return ok
@@ -0,0 +1,122 @@
+#
+# Copyright 2017 Geoff Williams for Declarative Systems PTY LTD
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+import threading
+import json
+import csv
+from json_store import JsonStore
+
+
+class BenchmarkResults:
+    """
+    BenchmarkResults
+
+    Results of every benchmark run, persisted so a batch of runs can be
+    compared with the batches before it.  Each result is one run from
+    nothing to a provisioned agent with the seconds taken by each phase,
+    runs started together share a `batch`
+    """
+
+    logger = logging.getLogger(__name__)
+
+    # phases in the order they run
+    PHASES = ["docker_init", "start_pe", "start_agent", "pe_ready", "agent_provision", "sign_cert", "first_run"]
+
+    # result fields in export order
+    FIELDS = [
+        "batch", "label", "run", "time", "master_image", "agent_image", "profile", "from_snapshot",
+        "ok", "failed_phase",
+    ] + PHASES + ["total"]
+
+    def __init__(self, path):
+        self.store = JsonStore(path, "benchmark results", list)
+        self.lock = threading.Lock()
+        self.results = self.store.load()
+
+    def add(self, result):
+        with self.lock, self.store.locked():
+            self.results = self.store.load()
+            self.results.append(result)
+            self.store.save(self.results)
+
+    def history(self, batch=None):
+        """Results oldest first, optionally only those from `batch`"""
+        with self.lock:
+            return [dict(result) for result in self.results if batch is None or result.get("batch") == batch]
+
+    def baseline(self, batch, label=None):
+        """
+        The batch to compare `batch` with: the newest earlier batch, or the
+        newest with `label` if given.  None if there isn't one
+        """
+        batches = [
+            result["batch"] for result in self.history()
+            if result["batch"] < batch and (label is None or result.get("label") == label)]
+        return max(batches) if batches else None
+
+    @staticmethod
+    def stats(results, phase):
+        """(mean, min, max) seconds of `phase` over the runs that completed it"""
+        values = [
+            result[phase] for result in results
+            if result.get(phase) is not None and
+            result.get("failed_phase") != phase and
+            (result.get("ok") or phase != "total")]
+        if not values:
+            return None, None, None
+        return sum(values) / len(values), min(values), max(values)
+
+    def compare(self, batch, baseline=None):
+        """
+        Per phase (phase, mean, min, max, baseline mean, change %) of the
+        runs in `batch` and those in `baseline`
+        """
+        current = self.history(batch)
+        previous = self.history(baseline) if baseline is not None else []
+        comparison = []
+        for phase in self.PHASES + ["total"]:
+            mean, minimum, maximum = self.stats(current, phase)
+            baseline_mean = self.stats(previous, phase)[0]
+            if mean is not None and baseline_mean:
+                change = (mean - baseline_mean) / baseline_mean * 100
+            else:
+                change = None
+            comparison.append((phase, mean, minimum, maximum, baseline_mean, change))
+        return comparison
+
+    @staticmethod
+    def report(comparison):
+        """comparison from `compare()` as a table for the terminal"""
+        def seconds(value):
+            return "{0:.1f}s".format(value) if value is not None else "-"
+
+        lines = ["{0:<16} {1:>8} {2:>8} {3:>8} {4:>9} {5:>8}".format(
+            "phase", "mean", "min", "max", "baseline", "change")]
+        for phase, mean, minimum, maximum, baseline_mean, change in comparison:
+            lines.append("{0:<16} {1:>8} {2:>8} {3:>8} {4:>9} {5:>8}".format(
+                phase, seconds(mean), seconds(minimum), seconds(maximum), seconds(baseline_mean),
+                "{0:+.1f}%".format(change) if change is not None else "-"))
+        return "\n".join(lines)
+
+    def export(self, f, fmt="json", batch=None):
+        """Write the results to the open file `f` as json or csv"""
+        history = self.history(batch)
+        if fmt == "csv":
+            writer = csv.DictWriter(f, self.FIELDS, extrasaction="ignore")
+            writer.writeheader()
+            writer.writerows(history)
+        else:
+            json.dump(history, f, indent=2)
@@ -0,0 +1,168 @@
+#
+# Copyright 2017 Geoff Williams for Declarative Systems PTY LTD
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+import threading
+import time
+import Queue
+
+
+class BootScheduler:
+    """
+    BootScheduler
+
+    Run the steps needed to bring up PE as a dependency graph.  Steps whose
+    dependencies are complete run concurrently on a small pool of worker
+    threads.  A step fails if it raises or returns `False`, in which case
+    everything that depends on it is skipped.  Steps can also run `after`
+    other steps, which only have to finish - successfully or not.
+    Wall-clock time is recorded for every step
+    """
+
+    logger = logging.getLogger(__name__)
+
+    MAX_WORKERS = 4
+
+    def __init__(self, max_workers=MAX_WORKERS):
+        self.max_workers = max_workers
+
+        # step name -> step, in the order they were added
+        self.steps = {}
+        self.order = []
+
+    # statuses of steps that won't run again
+    FINISHED = ["ok", "failed", "skipped"]
+
+    def add_step(self, name, func, depends=None, after=None):
+        """
+        Add a step called `name` running `func` once all steps in `depends`
+        have succeeded and all steps in `after` have finished
+        """
+        depends = depends or []
+        after = after or []
+        for dependency in depends + after:
+            if dependency not in self.steps:
+                raise ValueError(
+                    "step {name} depends on unknown step {dependency}".format(
+                        name=name, dependency=dependency))
+        self.steps[name] = {
+            "name": name,
+            "func": func,
+            "depends": list(depends),
+            "after": list(after),
+            "status": "pending",
+            "started": None,
+            "finished": None,
+            "duration": None,
+        }
+        self.order.append(name)
+
+    def ready(self):
+        """Names of pending steps whose dependencies have all completed"""
+        ready = []
+        for name in self.order:
+            step = self.steps[name]
+            if step["status"] == "pending" and all(
+                    self.steps[dependency]["status"] == "ok" for dependency in step["depends"]) and all(
+                    self.steps[other]["status"] in self.FINISHED for other in step["after"]):
+                ready.append(name)
+        return ready
+
+    def status(self, name):
+        """pending, running, ok, failed or skipped"""
+        return self.steps[name]["status"]
+
+    def skip_dependents(self, name):
+        """Mark everything downstream of a failed step as skipped"""
+        for other in self.order:
+            step = self.steps[other]
+            if step["status"] == "pending" and name in step["depends"]:
+                self.logger.info("skipping boot step {other}, {name} did not complete".format(
+                    other=other, name=name))
+                step["status"] = "skipped"
+                self.skip_dependents(other)
+
+    def worker(self, work, results):
+        while True:
+            name = work.get()
+            if name is None:
+                break
+            step = self.steps[name]
+            step["started"] = time.time()
+            try:
+                ok = step["func"]() is not False
+            except Exception as e:
+                self.logger.exception(e)
+                ok = False
+            step["finished"] = time.time()
+            step["duration"] = step["finished"] - step["started"]
+            results.put((name, ok))
+
+    def run(self):
+        """Run all steps, blocking until they are finished.  Returns True if all succeeded"""
+        work = Queue.Queue()
+        results = Queue.Queue()
+        workers = []
+        for i in range(self.max_workers):
+            thread = threading.Thread(target=self.worker, args=[work, results])
+            thread.start()
+            workers.append(thread)
+
+        started = time.time()
+        in_progress = 0
+        try:
+            while True:
+                for name in self.ready():
+                    self.logger.info("boot step {name} starting".format(name=name))
+                    self.steps[name]["status"] = "running"
+                    work.put(name)
+                    in_progress += 1
+
+                if not in_progress:
+                    break
+
+                name, ok = results.get()
+                in_progress -= 1
+                self.steps[name]["status"] = "ok" if ok else "failed"
+                self.logger.info("boot step {name} {status} in {duration:.1f}s".format(
+                    name=name,
+                    status=self.steps[name]["status"],
+                    duration=self.steps[name]["duration"]))
+                if not ok:
+                    self.skip_dependents(name)
+        finally:
+            for thread in workers:
+                work.put(None)
+
+        self.logger.info("boot finished in {duration:.1f}s:\n{timings}".format(
+            duration=time.time() - started,
+            timings=self.report()))
+
+        return all(self.steps[name]["status"] == "ok" for name in self.order)
+
+    def timings(self):
+        """step name -> duration in seconds (None if the step never ran)"""
+        return dict((name, self.steps[name]["duration"]) for name in self.order)
+
+    def report(self):
+        """Human readable table of step status and timings"""
+        lines = []
+        for name in self.order:
+            step = self.steps[name]
+            lines.append("  {name:<20} {status:<8} {duration}".format(
+                name=name,
+                status=step["status"],
+                duration="{0:.1f}s".format(step["duration"]) if step["duration"] is not None else "-"))
+        return "\n".join(lines)
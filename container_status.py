@@ -0,0 +1,142 @@
+#
+# Copyright 2017 Geoff Williams for Declarative Systems PTY LTD
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+import threading
+import time
+import calendar
+from lazy_module import LazyModule
+from event_watcher import EventWatcher
+
+docker = LazyModule("docker", "docker.errors")
+requests = LazyModule("requests", "requests.exceptions")
+dateutil = LazyModule("dateutil", "dateutil.parser")
+
+
+class ContainerStatus:
+    """
+    ContainerStatus
+
+    Track the state of our containers from the docker events stream so that
+    the GUI can read container uptime without hitting the daemon.  The
+    table is seeded with a single inspect per container, then kept up to
+    date by events.  If the stream drops we fall back to polling until
+    the daemon lets us subscribe again
+    """
+
+    logger = logging.getLogger(__name__)
+
+    # docker events that mean a container is now running or not running
+    RUNNING_ACTIONS = ["start", "restart", "unpause"]
+    STOPPED_ACTIONS = ["die", "stop", "kill", "pause", "oom", "destroy"]
+
+    def __init__(self, ll_cli, names, interval=1):
+        self.ll_cli = ll_cli
+        self.names = names
+        self.watcher = EventWatcher(
+            ll_cli,
+            {"type": "container", "container": names},
+            self.process_event,
+            on_subscribed=self.subscribed,
+            on_dropped=self.dropped,
+            interval=interval,
+        )
+
+        # container name -> epoch time the container started or None if the
+        # container is not running
+        self.started = {}
+        for name in names:
+            self.started[name] = None
+
+        # True while we are subscribed to the events stream
+        self.connected = False
+
+        self.lock = threading.Lock()
+
+    def uptime(self, name):
+        """
+        Return container uptime in seconds or false if its dead
+        """
+        with self.lock:
+            started = self.started.get(name)
+        if started is None:
+            uptime = False
+        else:
+            # a container that started this second is still alive
+            uptime = max(int(time.time() - started), 1)
+        return uptime
+
+    def inspect(self, name):
+        """Refresh a single container from `inspect_container`"""
+        started = None
+        try:
+            inspection = self.ll_cli.inspect_container(name)
+            if inspection["State"]["Status"] == "running":
+                started = calendar.timegm(
+                    dateutil.parser.parse(inspection["State"]["StartedAt"]).timetuple())
+        except docker.errors.NotFound:
+            pass
+        with self.lock:
+            self.started[name] = started
+
+    def poll(self):
+        """Refresh every container, used to seed the table and as a fallback"""
+        for name in self.names:
+            self.inspect(name)
+
+    def mark_stopped(self):
+        """The daemon went away - nothing can be running"""
+        with self.lock:
+            for name in self.started:
+                self.started[name] = None
+
+    def process_event(self, event):
+        """Update the state table from a single decoded docker event"""
+        action = event.get("Action") or event.get("status")
+        name = event.get("Actor", {}).get("Attributes", {}).get("name")
+        if name in self.started:
+            self.logger.debug("container {name} event: {action}".format(
+                name=name, action=action))
+            with self.lock:
+                if action in self.RUNNING_ACTIONS:
+                    self.started[name] = event.get("time", time.time())
+                elif action in self.STOPPED_ACTIONS:
+                    self.started[name] = None
+
+    def subscribed(self):
+        """
+        Seed the table only once subscribed so we can't miss an event that
+        happens in between
+        """
+        self.poll()
+        self.connected = True
+        self.logger.info("subscribed to docker events for " + ", ".join(self.names))
+
+    def dropped(self):
+        self.connected = False
+        if self.watcher.running:
+            # fallback to polling until we can subscribe again
+            try:
+                self.poll()
+            except (requests.exceptions.ConnectionError,
+                    requests.exceptions.ReadTimeout,
+                    docker.errors.APIError):
+                self.mark_stopped()
+
+    def start(self):
+        self.watcher.start()
+
+    def stop(self):
+        self.watcher.stop()
@@ -0,0 +1,1959 @@
+#
+# Copyright 2017 Geoff Williams for Declarative Systems PTY LTD
+# Copyright 2016 Geoff Williams for Puppet Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+import calendar
+from urlparse import urlparse
+import threading
+import time
+import os
+import datetime
+import json
+import pipes
+import re
+import argparse
+from functools import partial
+from utils import Utils
+from lazy_module import LazyModule
+from settings import Settings
+from notifier import LogNotifier
+from container_status import ContainerStatus
+from pe_status import PeStatusProber
+from boot_scheduler import BootScheduler
+from image_index import ImageIndex
+from hub_cache import HubTagCache
+from pull_progress import PullProgress, PullCancelled, PullError
+from download_manager import DownloadManager
+from exec_log import ExecLog
+from run_reports import RunReports
+from onceover_sync import OnceoverSync
+from tar_stream import TarStream
+from snapshots import Snapshots
+from stacks import Stacks
+from tracer import Tracer
+
+# heavy, only needed once we talk to docker or the hub
+docker = LazyModule("docker", "docker.errors")
+requests = LazyModule("requests", "requests.exceptions")
+dateutil = LazyModule("dateutil", "dateutil.parser")
+docker_hub = LazyModule("docker_hub")
+
+
+# borg class, see http://code.activestate.com/recipes/66531-singleton-we-dont-need-no-stinkin-singleton-the-bo/
+class Controller:
+    """
+    Controller
+
+    Separate off the control functions to remove dependency on kivy.  Must
+    not import kivy so that it can be driven headless
+    """
+    __shared_state = {}
+
+    logger = logging.getLogger(__name__)
+    settings = Settings()
+
+
+    # container names, image info and urls for each image.
+    #   * name - the name of the started container in docker, see `use_stack()`
+    #   * host - the hostname for the started container
+    #   * image_name - the name of the image used for this container
+    #   * local_images - the name+tags for this image that are available locally
+    #   * images - the name+tags for this image that are downloadable or local
+    #   * instance - object representing the running container, if started
+    #   * urls - URLs accessible in the started container
+    #   * status - current status of the container, updated every second by a thread
+    #   * port_bindings_func - name of function to run to obtain port mappings
+    #     to preserve liveness of settings
+    #   * resource_limits_func - name of function to run to obtain the limits
+    #     and tuning for the selected resource profile
+    #   * ports - dict of docker to local ports we will use to build URLs in the GUI
+    #   * from_snapshot - True if the container was started from a snapshot
+    container = {
+        "master": {
+            "name": "pe_kit_master__",
+            "host": "pe-puppet.localdomain",
+            "image_name": settings.master_image,
+            "local_images": [],
+            "images": [],
+            "instance": None,
+            "urls": {},
+            "status": False,
+            "port_bindings_func": "master_port_bindings",
+            "resource_limits_func": "master_resource_limits",
+            "from_snapshot": False,
+            "ports": {
+                "443/tcp": None,
+                "9000/tcp": None,
+            }
+        },
+        "agent": {
+            "name": "pe_kit_agent__",
+            "host": "agent.localdomain",
+            "image_name": settings.agent_image,
+            "local_images": [],
+            "images": [],
+            "instance": None,
+            "urls": {},
+            "status": False,
+            "port_bindings_func": "agent_port_bindings",
+            "resource_limits_func": "agent_resource_limits",
+            "from_snapshot": False,
+            "ports": {
+                "9090/tcp": None,
+            }
+        }
+    }
+
+    # Puppet.com suggested curl installation command (swallows exit status)
+    CURL_COMMAND="curl -k https://pe-puppet.localdomain:8140/packages/current/install.bash | bash"
+
+    # Save to intermediate file to prevent streaming errors and preserve exit status
+    CURL_COMMAND_SAFE="curl -k https://pe-puppet.localdomain:8140/packages/current/install.bash > /tmp/pe_installer && bash < /tmp/pe_installer"
+
+    MONITOR_THREAD_INTERVAL = 1
+
+    # Resource profiles for the containers.  Limits are passed to docker
+    # when the container is created, the puppetserver/puppetdb heaps and
+    # the number of JRuby instances are set by files added to the container
+    # before it starts, see `tuning_files()`.  `default` leaves the image as
+    # it is
+    PROFILES = {
+        "lowmem": {
+            "master": {
+                "mem_limit": "3g",
+                "cpu_shares": 512,
+                "puppetserver_heap": "768m",
+                "puppetdb_heap": "256m",
+                "jruby_instances": 1,
+            },
+            "agent": {
+                "mem_limit": "256m",
+                "cpu_shares": 256,
+            },
+        },
+        "default": {
+            "master": {},
+            "agent": {},
+        },
+        "loadtest": {
+            "master": {
+                "cpu_shares": 2048,
+                "puppetserver_heap": "4g",
+                "puppetdb_heap": "1g",
+                "jruby_instances": 6,
+            },
+            "agent": {
+                "mem_limit": "512m",
+                "cpu_shares": 256,
+            },
+        },
+    }
+
+    # profile settings that go straight to docker's host config
+    HOST_CONFIG_LIMITS = ["mem_limit", "cpu_shares", "cpuset_cpus"]
+
+    # profile setting -> service whose JAVA_ARGS heap it sets
+    TUNED_HEAPS = [("puppetserver_heap", "pe-puppetserver"), ("puppetdb_heap", "pe-puppetdb")]
+
+    SYSCONFIG = "/etc/sysconfig/{service}"
+    PUPPETSERVER_CONF = "/etc/puppetlabs/puppetserver/conf.d/pe-puppet-server.conf"
+
+    # runs each (name, command) pair passed as arguments in turn, printing
+    # a PIPELINE_MARKER line of JSON with the exit code and duration of each.
+    # The login environment is captured once per container and sourced
+    # afterwards so we only pay for `bash --login` on the first call.  It is
+    # captured again whenever /etc/profile(.d) changes - installing the
+    # puppet agent adds to the PATH - and written to a temporary file first
+    # so sessions running at the same time never source half of it
+    PIPELINE_RUNNER = r"""
+env_file=$1 ; stop_on_error=$2 ; shift 2
+if [ ! -s $env_file ] || [ /etc/profile -nt $env_file ] || [ /etc/profile.d -nt $env_file ] ; then
+    bash --login -c 'export -p' > $env_file.$$ && mv -f $env_file.$$ $env_file
+fi
+. $env_file
+while [ $# -gt 1 ] ; do
+    name=$1 ; cmd=$2 ; shift 2
+    started=$(date +%s%N)
+    ( eval "$cmd" )
+    exit_code=$?
+    finished=$(date +%s%N)
+    printf '\n{marker}{{"name": "%s", "exit_code": %d, "ms": %d}}\n' \
+        "$name" $exit_code $(( (finished - started) / 1000000 ))
+    [ $exit_code -ne 0 ] && [ $stop_on_error = true ] && exit $exit_code
+done
+exit 0
+"""
+    # puppet's summary of the last run, read with puppet's own ruby since
+    # the containers don't have anything else that understands YAML
+    LAST_RUN_SUMMARY = "/opt/puppetlabs/puppet/cache/state/last_run_summary.yaml"
+    PUPPET_RUBY = "/opt/puppetlabs/puppet/bin/ruby"
+
+    PIPELINE_MARKER = "PE_KIT_STEP "
+    PIPELINE_ENV_FILE = "/tmp/pe_kit_login_env"
+
+    # boot steps to run at once - enough to start and provision a few
+    # agents while others wait for PE
+    BOOT_WORKERS = 8
+
+    # seconds to wait for the agent certificate request to reach the master
+    CSR_TIMEOUT = 60
+
+    # attempts at pulling an image before giving up, and the delay between
+    # them (multiplied by the attempt number)
+    PULL_ATTEMPTS = 5
+    PULL_RETRY_DELAY = 5
+
+    cli = None
+
+    docker_url = None
+    docker_address = "unknown"
+    # where to send messages for the user, the GUI replaces this with itself
+    notifier = LogNotifier()
+    daemon_status = "stopped"
+    update_available = False
+    dm = None
+
+    # DownloadManager queueing image pulls once docker is up
+    download_manager = None
+
+    # ContainerStatus instance tracking our containers once docker is up
+    container_status = None
+
+    # ImageIndex of local image tags once docker is up
+    image_index = None
+
+    # app/program is running - threads use this to see if they should
+    # continue executing
+    running = True
+
+    # When new images are loaded, this flag is set true to flag the GUI
+    # to refresh.  We must use a variable to communicate with the GUI thread
+    # because since the update takes place in its own thread, we can't let
+    # it interact with the GUI thread or we'll get segfaults
+    images_refreshed = False
+
+    # Set once the inital image list and setup is complete
+    inital_setup_complete = threading.Event()
+
+    # Set once the GUI is live an selections in the settings
+    # object have been parsed in
+    gui_ready = threading.Event()
+
+    # DockerHubClient, created on first use - keeps our hub token and
+    # connections between refreshes
+    hub = None
+
+    # HubTagCache of hub tag listings, persisted between runs
+    hub_cache = None
+
+    # serialise updates to the image lists and hub revalidation
+    images_lock = threading.Lock()
+    revalidate_lock = threading.Lock()
+
+    # master and agents start together, only one of them creates the network
+    network_lock = threading.Lock()
+
+    # PeStatusProber instance polling the PE console in the background
+    pe_status_prober = None
+
+    # step name -> seconds taken by the last automatic boot
+    boot_timings = {}
+
+    # seconds the last automatic boot took from start to finish
+    boot_duration = None
+
+    # Snapshots we have taken once docker is up
+    snapshots = None
+
+    # output of commands run in the containers
+    exec_log = ExecLog()
+
+    # RunReports history of puppet runs once docker is up
+    run_reports = None
+
+    # StartupTimeline to record milestones on, if the GUI is tracking them
+    timeline = None
+
+    # CLI overrides of settings, see `configure()`
+    master_image = False
+    agent_image = False
+    provision_automatically = True
+    onceover_dir = False
+    sync_onceover = False
+    run_puppet_on_sync = False
+    disable_puppet_on_master = False
+
+    # CLI override to fast start from snapshots
+    from_snapshot = False
+
+    # CLI override of the resource profile
+    profile = False
+
+    # file to write the trace to when we stop, see `Tracer`
+    trace_file = False
+
+    # name of the stack we are managing, False for the default stack, see
+    # `use_stack()`
+    stack = False
+
+    # Stacks with the host ports of each named stack
+    stacks = None
+
+    # label on every container we create with the name of its stack
+    STACK_LABEL = "pe_kit.stack"
+    DEFAULT_STACK = "default"
+
+    # host ports published by the master when expose_ports is set
+    EXPOSED_PORTS = [8140, 8142, 8170, 61613]
+
+    # OnceoverSync copying the control repo into the master when syncing
+    onceover_sync = None
+
+    # local image repository for snapshots, tagged with the container key
+    SNAPSHOT_REPO = "pe_kit_snapshot"
+
+    # where the control repo goes on the master
+    ENVIRONMENT_DIR = "/etc/puppetlabs/code/environments/production"
+
+    def __init__(self):
+        self.__dict__ = self.__shared_state
+
+    @staticmethod
+    def add_arguments(parser):
+        """Add the command line options shared by the GUI and headless mode"""
+        parser.add_argument("--onceover-dir", default=False, help="Path to a control repository configured with onceover")
+        parser.add_argument("--onceover-sync", default=False, action="store_true", help="Copy changes to --onceover-dir into the master as they happen instead of bind mounting it")
+        parser.add_argument("--onceover-run-puppet", default=False, action="store_true", help="Run puppet on the agents after each --onceover-sync")
+        parser.add_argument("--disable-puppet-on-master", default=False, action="store_true", help="Disable running puppet on the puppet master")
+        parser.add_argument("--master-image", default=False, help="Image to run puppet master with")
+        parser.add_argument("--agent-image", default=False, help="Image to run puppet agent node with")
+        parser.add_argument("--from-snapshot", action="store_true", default=False, help="Start containers from snapshots instead of booting PE from scratch")
+        parser.add_argument("--profile", default=False, choices=sorted(Controller.PROFILES), help="Resource profile for the containers")
+        parser.add_argument("--stack", default=False, type=Controller.stack_name, help="Name of a separate master+agent stack to manage, lets several run on one docker host")
+        parser.add_argument("--trace", default=False, metavar="FILE", help="Write a Chrome trace of what PE_Kit did to FILE on exit")
+        parser.add_argument("--no-auto-provision", action="store_true", default=False, help="Do not install the puppet agent")
+
+    def configure(self, args):
+        """Apply the options from `add_arguments` once parsed"""
+        if args.onceover_dir and not os.path.isdir(args.onceover_dir):
+            self.logger.error("%s specified by --onceover-dir does not exist" % args.onceover_dir)
+        self.onceover_dir = args.onceover_dir
+        self.sync_onceover = args.onceover_sync
+        self.run_puppet_on_sync = args.onceover_run_puppet
+        self.disable_puppet_on_master = args.disable_puppet_on_master
+        self.master_image = args.master_image
+        self.agent_image = args.agent_image
+        self.provision_automatically = not args.no_auto_provision
+        self.from_snapshot = args.from_snapshot
+        self.profile = args.profile
+        self.trace_file = args.trace
+        if args.stack and args.stack != self.DEFAULT_STACK:
+            self.use_stack(args.stack)
+
+    @staticmethod
+    def stack_name(value):
+        """argparse type for stack names, which end up in container names"""
+        if not re.match(r"^[a-zA-Z0-9][a-zA-Z0-9_.-]*$", value):
+            raise argparse.ArgumentTypeError("invalid stack name " + value)
+        return value
+
+    def use_stack(self, stack):
+        """Manage the containers of stack `stack` instead of the default stack"""
+        self.stack = stack
+        for container_key in self.container:
+            self.container[container_key]["name"] = self.container_name(container_key)
+
+    def container_name(self, container_key):
+        """docker name of the container for `container_key` in our stack"""
+        if self.stack:
+            name = "pe_kit_{stack}_{container_key}__".format(stack=self.stack, container_key=container_key)
+        else:
+            name = "pe_kit_{container_key}__".format(container_key=container_key)
+        return name
+
+    def stack_ports(self, ports):
+        """
+        host port for each of `ports`.  The default stack uses the ports
+        themselves, named stacks get their own
+        """
+        if self.stack:
+            allocated = self.stacks.allocate(self.stack, ports, self.host_ports_in_use())
+        else:
+            allocated = dict((port, port) for port in ports)
+        return allocated
+
+    def host_ports_in_use(self):
+        """host ports published by any running container"""
+        return set(
+            port["PublicPort"]
+            for container in self.ll_cli.containers()
+            for port in container.get("Ports", [])
+            if port.get("PublicPort"))
+
+    def list_stacks(self):
+        """
+        Every stack on the docker host or with ports allocated, as stack
+        name -> {"containers": [(name, status)], "ports": {port: host port}}
+        """
+        stacks = {}
+        for container in self.ll_cli.containers(all=True, filters={"label": self.STACK_LABEL}):
+            stack = stacks.setdefault(container["Labels"][self.STACK_LABEL], {"containers": [], "ports": {}})
+            stack["containers"].append((container["Names"][0].lstrip("/"), container["Status"]))
+
+        for name in self.stacks.names():
+            stacks.setdefault(name, {"containers": [], "ports": {}})["ports"] = dict(
+                (int(port), host_port) for port, host_port in self.stacks.get(name)["ports"].items())
+        return stacks
+
+    def remove_stack(self):
+        """Stop our containers and release the ports of a named stack"""
+        self.stop_all_docker_containers()
+        self.remove_network()
+        if self.stack:
+            self.stacks.remove(self.stack)
+
+
+    def pe_url(self):
+        try:
+            url = self.container["master"]["urls"]["443/tcp"]
+        except KeyError:
+            url = None
+        return url
+
+    def demo_url(self):
+        return self.container["agent"]["urls"]["9090/tcp"]
+
+    def agents(self):
+        """keys of all agent containers, in order"""
+        return ["agent"] + [
+            "agent{number}".format(number=number) for number in range(2, self.settings.agent_count + 1)]
+
+    def add_agents(self):
+        """add container entries for any extra agents asked for in settings"""
+        for number, container_key in enumerate(self.agents()[1:], 2):
+            if container_key not in self.container:
+                agent = self.container["agent"]
+                self.container[container_key] = dict(
+                    agent,
+                    name=self.container_name(container_key),
+                    host="agent{number}.localdomain".format(number=number),
+                    instance=None,
+                    urls={},
+                    status=False,
+                    ports=dict((port, None) for port in agent["ports"]),
+                    from_snapshot=False,
+                )
+
+    def curl_command(self):
+        return self.CURL_COMMAND_SAFE
+
+    def delete_image(self, image_name):
+        self.cli.remove_image(image_name)
+        self.image_index.invalidate()
+        self.refresh_images()
+
+    def queue_download(self, image_name):
+        """Queue an image for download by the download manager"""
+        self.download_manager.enqueue(image_name, self.download_priority(image_name))
+
+        # redraw the images grid to show the download
+        self.images_refreshed = True
+
+    def download_priority(self, image_name):
+        """Master images before agent images, then newest tag first"""
+        container_keys = ["master", "agent"]
+        for kind_rank, container_key in enumerate(container_keys):
+            image_names = [image["name"] for image in self.container[container_key]["images"]]
+            if image_name in image_names:
+                return (kind_rank, image_names.index(image_name))
+        return (len(container_keys), 0)
+
+    def downloading(self, image_name):
+        """True if an image is queued or downloading"""
+        return self.download_manager is not None and self.download_manager.active(image_name)
+
+    @Tracer.traced
+    def download_image(self, image_name):
+        """Download an image, called by the download manager.  Returns True on success"""
+        self.logger.info("starting download of:  " + image_name)
+        progress = PullProgress(image_name)
+        self.download_manager.set_progress(image_name, progress)
+        ok = False
+        try:
+            self.pull_image(progress)
+            progress.finished = True
+            ok = True
+            self.logger.info("finished download of:  " + image_name)
+        except PullCancelled:
+            self.logger.info("download of {image_name} cancelled".format(image_name=image_name))
+        except (PullError, docker.errors.APIError,
+                requests.exceptions.ConnectionError,
+                requests.exceptions.Timeout) as e:
+            self.logger.exception(e)
+            progress.status = "failed: " + str(e)
+            self.notifier.error("Failed to download {image_name}: {error}".format(
+                image_name=image_name, error=e))
+
+        # local images have changed
+        self.image_index.invalidate()
+        self.refresh_images()
+        return ok
+
+    def pull_image(self, progress):
+        """
+        Pull an image, feeding the stream into `progress`.  Dropped
+        connections, read timeouts and server errors are retried - layers
+        that were already completed are kept by docker so a retry picks up
+        where we left off.  Auth and not found errors fail straight away
+        """
+        image_name_split = progress.image_name.split(":")
+        while True:
+            progress.attempt += 1
+            try:
+                for event in self.ll_cli.pull(
+                  repository = image_name_split[0],
+                  tag = image_name_split[1],
+                  stream = True,
+                  decode = True,
+                ):
+                    if self.download_manager.cancelled(progress.image_name):
+                        raise PullCancelled()
+                    progress.feed(event)
+                return
+            except PullError as e:
+                transient = not e.permanent()
+                error = e
+            except (requests.exceptions.ConnectionError,
+                    requests.exceptions.ReadTimeout,
+                    requests.exceptions.ChunkedEncodingError) as e:
+                # ChunkedEncodingError is the connection dropping mid-stream
+                transient = True
+                error = e
+            except docker.errors.APIError as e:
+                transient = e.is_server_error()
+                error = e
+
+            if not transient or progress.attempt >= self.PULL_ATTEMPTS:
+                raise error
+
+            delay = self.PULL_RETRY_DELAY * progress.attempt
+            self.logger.error(
+                "download of {image_name} failed ({error}), retrying in {delay}s".format(
+                    image_name=progress.image_name, error=error, delay=delay))
+            progress.status = "retrying"
+            time.sleep(delay)
+            if self.download_manager.cancelled(progress.image_name):
+                raise PullCancelled()
+
+    def download_progress(self, image_name):
+        """PullProgress for an active download or None"""
+        status = self.download_manager.status(image_name) if self.download_manager else None
+        return status["progress"] if status else None
+
+    def stop_download(self, image_name):
+        """abort a queued or running download"""
+        self.download_manager.cancel(image_name)
+        self.refresh_images()
+
+    def update_status(self):
+        """
+        daemon thread to check if docker and container are alive.  Container
+        state comes from the docker events stream, we only need to ask the
+        daemon if its alive when we aren't subscribed to it
+        """
+        while (self.running):
+            previous_status = self.daemon_status
+            if self.container_status and self.container_status.connected:
+                self.daemon_status = "running"
+            else:
+                self.daemon_status = self.daemon_alive()
+
+            if self.timeline and self.daemon_status == "running" and previous_status != "running":
+                self.timeline.mark("docker connected")
+
+            if self.daemon_status == "running" and self.container_status:
+                for container_key in self.container:
+                    container = self.container[container_key]
+                    container["status"] = self.container_status.uptime(container["name"])
+            else:
+                for container_key in self.container:
+                    self.container[container_key]["status"] = False
+            time.sleep(self.MONITOR_THREAD_INTERVAL)
+
+    def pe_status(self):
+        """return status of PE master: running, loading, error"""
+        if self.pe_status_prober:
+            status = self.pe_status_prober.status()
+        else:
+            status = "error"
+        return status
+
+    def pe_status_snapshot(self):
+        """return the latest status, message and latency published by the prober"""
+        if self.pe_status_prober:
+            snapshot = self.pe_status_prober.get()
+        else:
+            snapshot = {"status": "error", "message": "error", "latency": None, "checked": None}
+        return snapshot
+
+    @Tracer.traced
+    def cleanup_container(self, container):
+        """on-startup cleanup of orphaned containers (if requested)"""
+        try:
+            if self.ll_cli.inspect_container(container["name"]):
+                if self.settings.kill_orphans:
+                    self.logger.info("killing orphaned container: " + container["name"])
+                    self.ll_cli.remove_container(container["name"], force=True)
+                else:
+                    self.logger.info("inspecting existing container")
+                    container["instance"] = self.ll_cli.inspect_container(
+                        container["name"])
+                    if container["instance"]["State"]["Running"]:
+                        self.munge_urls(container)
+                    # else container exists but has not yet been started, leave it
+                    # alone until its started by the start_automatically flag or
+                    # a user manually pressing the play button
+        except docker.errors.NotFound:
+            self.logger.info(
+                "container {container} not running, OK to start new one".format(
+                    container=container["name"]))
+
+    def network_name(self):
+        """docker network our stack's containers are attached to"""
+        return "pe_kit_" + self.stack if self.stack else "pe_kit"
+
+    def network_aliases(self, container):
+        """names `container` can be reached by from the others, eg pe-puppet.localdomain and pe-puppet"""
+        return [container["host"], container["host"].split(".")[0]]
+
+    @Tracer.traced
+    def ensure_network(self):
+        """
+        Create our network if it doesn't exist yet.  Docker's DNS on a user
+        defined network resolves the aliases of each container so the
+        agents can find the master as soon as they start
+        """
+        with self.network_lock:
+            name = self.network_name()
+            if not self.ll_cli.networks(names=[name]):
+                self.logger.info("creating docker network " + name)
+                self.ll_cli.create_network(
+                    name,
+                    driver="bridge",
+                    labels={self.STACK_LABEL: self.stack or self.DEFAULT_STACK})
+        return name
+
+    def remove_network(self):
+        try:
+            self.ll_cli.remove_network(self.network_name())
+        except docker.errors.NotFound:
+            pass
+        except docker.errors.APIError as e:
+            self.logger.error("unable to remove docker network {name}: {error}".format(
+                name=self.network_name(), error=e.explanation or e.message))
+
+    @Tracer.traced
+    def docker_connect(self):
+        """Connect to the docker daemon and start watching containers, images and downloads"""
+        self.cli = docker.DockerClient(base_url='unix://var/run/docker.sock')
+        self.ll_cli = docker.APIClient(base_url='unix://var/run/docker.sock')
+        Tracer().trace_session(self.cli.api, "docker")
+        Tracer().trace_session(self.ll_cli, "docker")
+
+        # before anything starts watching the containers by name
+        self.add_agents()
+
+        # container status from the docker events stream
+        self.container_status = ContainerStatus(
+            self.ll_cli,
+            [self.container[container_key]["name"] for container_key in self.container],
+            self.MONITOR_THREAD_INTERVAL,
+        )
+        self.container_status.start()
+
+        # local image tags, rebuilt when images change
+        self.image_index = ImageIndex(self.ll_cli)
+        self.image_index.start()
+
+        # image pulls, limited to a few at a time
+        self.download_manager = DownloadManager(
+            self.download_image, self.settings.max_concurrent_downloads)
+        self.download_manager.start()
+
+        self.docker_url = "https://{bridge_ip}".format(bridge_ip='localhost')
+        self.logger.info("Docker URL: " + self.docker_url)
+
+        self.hub_cache = HubTagCache(Settings.HUB_CACHE_FILE, self.settings.hub_cache_ttl)
+        self.run_reports = RunReports(Settings.REPORTS_FILE)
+        self.snapshots = Snapshots(Settings.SNAPSHOTS_FILE)
+        self.stacks = Stacks(Settings.STACKS_FILE)
+
+    @Tracer.traced
+    def docker_init(self):
+        self.docker_connect()
+
+        # stop any existing container (eg if we were killed), including the
+        # extra agents added by docker_connect
+        self.add_agents()
+        for container_key in ["master"] + self.agents():
+            self.cleanup_container(self.container[container_key])
+
+        # login to docker hub to pull private images - this is only needed
+        # for downloads so don't hold up startup waiting for it
+        threading.Thread(target=self.hub_login_check).start()
+
+        # update downloadble and local images on the settings page
+        self.refresh_images()
+
+        # proceed to startup
+        self.autostart_containers()
+
+    @Tracer.traced
+    def attach_containers(self):
+        """Pick up containers left running by a previous run without restarting them"""
+        for container_key in self.container:
+            container = self.container[container_key]
+            try:
+                container["instance"] = self.ll_cli.inspect_container(container["name"])
+                if container["instance"]["State"]["Running"]:
+                    self.munge_urls(container)
+            except docker.errors.NotFound:
+                container["instance"] = None
+
+    @Tracer.traced
+    def select_images(self):
+        """
+        Use the newest local image for any container without an image selected
+        in settings (or if settings ask for the latest image)
+        """
+        for container_key, setting in [("master", "master_selected_image"),
+                                       ("agent", "agent_selected_image")]:
+            if self.settings.use_latest_image or not getattr(self.settings, setting):
+                local_images, newest_image = self.update_local_images(self.container[container_key])
+                if newest_image:
+                    self.logger.info("selected {image} for {container_key}".format(
+                        image=newest_image, container_key=container_key))
+                    setattr(self.settings, setting, newest_image)
+
+    def hub_login_check(self):
+        if not self.hub_login():
+            self.notifier.error(
+                "Unable to login to registry at {hub_address}, please check details".format(
+                    hub_address=self.settings.hub_address
+                )
+            )
+
+    @Tracer.traced
+    def hub_login(self):
+        """
+        Login to docker hub.  Return true on success otherwise false.
+        This allows the CLI object to do stuff with the private hub images.  We still
+        need to do our own separate authentication for docker hub API calls to get a
+        list of image tags since this isn't possible using the client
+        """
+        status = False
+        if self.settings.hub_username and self.settings.hub_password and self.settings.hub_address:
+            self.logger.info("Logging in to docker hub...(WARNING - this takes a while to fail)")
+            try:
+                login_result = self.cli.login(
+                    username=self.settings.hub_username,
+                    password=self.settings.hub_password,
+                    registry='https://index.docker.io/v1', #self.settings.hub_address,
+                )
+                self.logger.debug("LOGIN result " + str(login_result))
+                if login_result:
+                    if 'username' in login_result:
+                      self.logger.info('already logged in...')
+                      status = True
+                    elif ('Status' in login_result and
+                          login_result["Status"] == 'Login Succeeded'):
+                      self.logger.info('logged in ok')
+                      status = True
+                    else:
+                      self.logger.info('hub login failed')
+                      status = False
+                else:
+                    status = False
+            except docker.errors.APIError as e:
+                self.logger.exception(e)
+                self.logger.error("Error logging in to hub - see previous error")
+
+            self.logger.info("...login done! status={status}".format(status=status))
+        else:
+            self.logger.info("Not logging into docker hub - missing credentials in settings")
+        return status
+
+    @Tracer.traced
+    def autostart_containers(self):
+        if self.settings.start_automatically:
+            self.logger.info("starting PE and agent containers automatically...")
+            ready, waited = Utils.wait_event(
+                self.gui_ready,
+                description="GUI ready",
+                running=lambda: self.running,
+            )
+            if not ready:
+                return
+            self.logger.info("Finished waiting for GUI to start, booting containers...")
+            self.boot()
+
+    @Tracer.traced
+    def boot(self):
+        """Start (and provision if requested) the master and agent, returns True on success"""
+
+        self.choose_snapshots()
+
+        # master and agent are independent, start them together so the
+        # agent is ready by the time PE has finished booting
+        scheduler = BootScheduler(self.BOOT_WORKERS)
+        scheduler.add_step("start_master", self.start_pe)
+        for container_key in self.agents():
+            scheduler.add_step("start_" + container_key, partial(self.start_agent, container_key))
+        if self.tuning_checks(self.master_resource_limits()):
+            scheduler.add_step("check_tuning", self.check_tuning, depends=["start_master"])
+
+        # CLI + settings...
+        if self.provision_automatically and self.settings.provision_automatically:
+            self.logger.debug("provisioning puppet agents automatically...")
+            self.provision_steps(scheduler, ["start_master"], dict(
+                (container_key, ["start_" + container_key]) for container_key in self.agents()))
+
+        started = time.time()
+        status = scheduler.run()
+        self.boot_timings = scheduler.timings()
+        self.boot_duration = time.time() - started
+        if self.container["master"]["from_snapshot"]:
+            self.report_time_saved()
+        return status
+
+    def provision_steps(self, scheduler, master_depends, agent_depends):
+        """
+        Add the steps to provision, sign and run puppet on agents to
+        `scheduler`.  Waiting for PE depends on `master_depends` and
+        provisioning each agent on its entry in the `agent_depends` dict of
+        container key -> steps.  Agents are provisioned concurrently, then
+        the certificates of all those that succeeded are signed together
+        """
+        container_keys = [
+            container_key for container_key in self.agents() if container_key in agent_depends]
+        scheduler.add_step("wait_pe_ready", self.wait_pe_ready, depends=master_depends)
+        for container_key in container_keys:
+            # agents from snapshots are already provisioned and signed
+            scheduler.add_step(
+                "provision_" + container_key,
+                lambda container_key=container_key: (
+                    self.container[container_key]["from_snapshot"] or
+                    self.agent_provision(container_key) == 0),
+                depends=agent_depends[container_key] + ["wait_pe_ready"])
+
+        # sign whatever was provisioned, a broken agent shouldn't stop the rest
+        scheduler.add_step(
+            "sign_certs",
+            lambda: self.sign_agent_certs([
+                self.container[container_key]["host"] for container_key in container_keys
+                if scheduler.status("provision_" + container_key) == "ok" and
+                not self.container[container_key]["from_snapshot"]]),
+            after=["provision_" + container_key for container_key in container_keys])
+        for container_key in container_keys:
+            scheduler.add_step(
+                "run_puppet_" + container_key,
+                lambda container_key=container_key: self.run_puppet(self.container[container_key]) in (0, 2),
+                depends=["provision_" + container_key],
+                after=["sign_certs"])
+
+    def daemon_alive(self):
+        """
+        Return 'running' if docker daemon is alive, 'loading' if starting, 'stopped' otherwise
+        """
+        if self.cli:
+            try:
+                version_info = self.cli.version()
+                if "Version" in version_info:
+                    alive = "running"
+                else:
+                    alive = "stopped"
+            except (requests.exceptions.ConnectionError, requests.exceptions.ReadTimeout):
+                self.logger.error("requests (wrapped urllib3) error talking to docker daemon")
+                alive = "stopped"
+        elif self.dm and self.dm.in_progress:
+            alive = "loading"
+        else:
+            alive = "stopped"
+        return alive
+
+    @Tracer.traced
+    def container_alive(self, container):
+        """
+        Return container uptime or false if its dead.  Answered from the
+        docker events stream while we are subscribed to it, only asking the
+        daemon when we aren't
+        """
+        alive = False
+        if (self.container_status and self.container_status.connected and
+                container["name"] in self.container_status.names):
+            alive = self.container_status.uptime(container["name"])
+        elif self.cli:
+            try:
+                inspection = self.ll_cli.inspect_container(container["name"])
+                if inspection["State"]["Status"] == "running":
+                    started = calendar.timegm(
+                      dateutil.parser.parse(inspection["State"]["StartedAt"]).timetuple())
+                    now = calendar.timegm(datetime.datetime.utcnow().timetuple())
+
+                    alive = now - started
+            except requests.exceptions.ConnectionError:
+                self.logger.error("urllib3 error talking to docker daemon")
+            except docker.errors.NotFound:
+                pass
+        return alive
+
+    def toggle_docker_container(self, container_key):
+        self.logger.debug("toggle_docker_container clicked")
+        container = self.container[container_key]
+        if self.container_alive(container):
+            self.stop_docker_container(container)
+        else:
+            if container_key == "master":
+                self.choose_snapshot(container_key)
+                self.start_pe()
+            elif container_key in self.agents():
+                self.choose_snapshot(container_key)
+                self.start_agent(container_key)
+            else:
+                self.logger.error("requested unknown container start: " + container_key)
+
+    def stop_all_docker_containers(self):
+        for container in self.container:
+            self.stop_docker_container(self.container[container])
+
+    def stop_docker_container(self, container):
+        # check we are still alive as this also gets called when we shut down
+        if self.container_alive(container):
+            self.logger.info("stopping container " + container["name"])
+            self.ll_cli.remove_container(container=container["name"], force=True)
+
+    def start_docker_daemon(self):
+        # PE console readiness in own thread - start first since booting
+        # waits on it
+        self.logger.info("starting PE status prober in own thread")
+        self.pe_status_prober = PeStatusProber(self.pe_url)
+        self.pe_status_prober.start()
+
+        # docker startup in own thread
+        self.logger.info("starting docker_init in own thread")
+        threading.Thread(target=self.docker_init).start()
+
+        # self-monitoring/status in own thread
+        self.logger.info("starting update_status in own thread")
+        threading.Thread(target=self.update_status).start()
+
+    def stop(self):
+        """signal all threads to stop"""
+        self.running = False
+        if self.container_status:
+            self.container_status.stop()
+        if self.image_index:
+            self.image_index.stop()
+        if self.download_manager:
+            self.download_manager.stop()
+        if self.pe_status_prober:
+            self.pe_status_prober.stop()
+        if self.onceover_sync:
+            self.onceover_sync.stop()
+        if self.trace_file:
+            self.export_trace(self.trace_file)
+
+    def export_trace(self, path):
+        """Write the trace of everything so far to `path`, returns True on success"""
+        try:
+            count = Tracer().export(path)
+        except (IOError, OSError) as e:
+            self.logger.error("unable to write trace {path}: {e}".format(path=path, e=e))
+            return False
+        self.logger.info("trace of {count} spans written to {path}".format(count=count, path=path))
+        return True
+
+    def master_port_bindings(self):
+        exposed = self.stack_ports(self.EXPOSED_PORTS) if self.settings.expose_ports else {}
+        return {
+            22: None,
+            443: None,
+            8140: exposed.get(8140),
+            8142: exposed.get(8142),
+            8170: exposed.get(8170),
+            9000: None,
+            61613: exposed.get(61613),
+            61616: None,
+        }
+
+    def agent_port_bindings(self):
+        return {
+            80: None,
+            9090: None,
+        }
+
+    def resource_profile(self):
+        """name of the resource profile to use, the CLI overrides settings"""
+        profile = self.profile or self.settings.profile
+        if profile not in self.PROFILES:
+            self.logger.error("unknown resource profile {profile}, using default".format(profile=profile))
+            profile = "default"
+        return profile
+
+    def master_resource_limits(self):
+        return self.PROFILES[self.resource_profile()]["master"]
+
+    def agent_resource_limits(self):
+        return self.PROFILES[self.resource_profile()]["agent"]
+
+    def tuning_scripts(self, limits):
+        """
+        service -> shell commands tuning it to `limits`.  Only the heap sizes
+        in the image's JAVA_ARGS are changed so the other JVM flags PE ships
+        (tmpdir, GC logging, OOM handling) are kept
+        """
+        scripts = {}
+        for key, service in self.TUNED_HEAPS:
+            if limits.get(key):
+                scripts.setdefault(service, []).append(
+                    "sed -i -E '/^JAVA_ARGS=/ s/-Xm([sx])[0-9]+[kKmMgG]?/-Xm\\1{heap}/g' {sysconfig}".format(
+                        heap=limits[key], sysconfig=self.SYSCONFIG.format(service=service)))
+        if limits.get("jruby_instances"):
+            scripts.setdefault("pe-puppetserver", []).append(
+                "sed -i -E 's/(max-active-instances:).*/\\1 {count}/' {conf}".format(
+                    count=limits["jruby_instances"], conf=self.PUPPETSERVER_CONF))
+        return scripts
+
+    def tuning_checks(self, limits):
+        """(description, shell test) for each setting `tuning_scripts()` should have made"""
+        checks = []
+        for key, service in self.TUNED_HEAPS:
+            if limits.get(key):
+                checks.append((
+                    "{service} heap of {heap}".format(service=service, heap=limits[key]),
+                    "grep -q -E '^JAVA_ARGS=.*-Xmx{heap}[ \"]' {sysconfig}".format(
+                        heap=limits[key], sysconfig=self.SYSCONFIG.format(service=service))))
+        if limits.get("jruby_instances"):
+            checks.append((
+                "{count} JRuby instances".format(count=limits["jruby_instances"]),
+                "grep -q -E 'max-active-instances: *{count}\\b' {conf}".format(
+                    count=limits["jruby_instances"], conf=self.PUPPETSERVER_CONF)))
+        return checks
+
+    def tuning_files(self, limits):
+        """
+        (name in archive, contents) of the files that tune the PE services
+        in a container to `limits`: a script per service and a systemd
+        drop-in running it before the service starts.  PE's own puppet runs
+        on the master manage these settings too, so each script only runs
+        once - otherwise every run would put them back and restart the
+        service, then the script would change them again.  `check_tuning()`
+        reports settings that didn't take or that puppet has reset
+        """
+        files = []
+        scripts = self.tuning_scripts(limits)
+        for service in sorted(scripts):
+            script = "/etc/pe_kit/tune-{service}.sh".format(service=service)
+            marker = "/etc/pe_kit/{service}.tuned".format(service=service)
+            files.append((
+                script.lstrip("/"),
+                "\n".join(
+                    ["#!/bin/bash", "[ -e {marker} ] && exit 0".format(marker=marker)] +
+                    scripts[service] +
+                    ["touch " + marker, ""]).encode("utf-8")))
+
+            # PermissionsStartOnly so the edit runs as root, not pe-puppet
+            files.append((
+                "etc/systemd/system/{service}.service.d/pe_kit.conf".format(service=service),
+                "\n".join([
+                    "[Service]",
+                    "PermissionsStartOnly=true",
+                    "ExecStartPre=-/bin/bash " + script,
+                    ""]).encode("utf-8")))
+        return files
+
+    @Tracer.traced
+    def check_tuning(self):
+        """
+        Once PE is up, log any master setting from the resource profile that
+        isn't in effect.  Never fails the boot, this is only a warning
+        """
+        checks = self.tuning_checks(self.master_resource_limits())
+        if checks and self.wait_pe_ready():
+            for description, test in checks:
+                if self.bash_exec(self.container["master"], test) != 0:
+                    self.logger.error(
+                        "{profile} profile: {description} is not in effect on the master, the setting is "
+                        "missing from the image or a puppet run on the master has reset it".format(
+                            profile=self.resource_profile(), description=description))
+        return True
+
+    @Tracer.traced
+    def start_agent(self, container_key="agent"):
+        """ start agent container """
+        if self.agent_image:
+            self.logger.info("Using agent image: " + self.agent_image)
+            self.container[container_key]["image_name"] = self.agent_image
+
+        return self.start_container(
+            self.container[container_key],
+            self.container_image(container_key, self.agent_selected_image()),
+        )
+
+    @Tracer.traced
+    def start_pe(self):
+        """ Start PE """
+        status = self.start_container(
+            self.container["master"],
+            self.container_image("master", self.master_selected_image()),
+        )
+
+        if status and self.disable_puppet_on_master:
+            self.disable_puppet(self.container["master"])
+
+        if status and self.settings.licence_file:
+            self.install_licence()
+
+        if status and self.onceover_dir and self.sync_onceover:
+            self.start_onceover_sync()
+
+        return status
+
+    def snapshot_key(self, container_key):
+        """
+        snapshot tag and Snapshots key for `container_key` in our stack.  The
+        default stack keeps the plain container key, like its container names
+        """
+        if self.stack:
+            key = "{stack}_{container_key}".format(stack=self.stack, container_key=container_key)
+        else:
+            key = container_key
+        return key
+
+    def snapshot_image(self, container_key):
+        return "{repo}:{tag}".format(repo=self.SNAPSHOT_REPO, tag=self.snapshot_key(container_key))
+
+    def master_selected_image(self):
+        return self.master_image or self.settings.master_selected_image
+
+    def agent_selected_image(self):
+        return self.agent_image or self.settings.agent_selected_image
+
+    def choose_snapshot(self, container_key):
+        """
+        Decide whether `container_key` starts from its snapshot: only if we
+        are fast starting and have one taken from the selected image.  The
+        master decides for the agents - an agent snapshotted against the
+        CA of an old master can't talk to one booted from scratch
+        """
+        container = self.container[container_key]
+        if container_key == "master":
+            allowed = True
+            image_name = self.master_selected_image()
+        else:
+            allowed = self.container["master"]["from_snapshot"]
+            image_name = self.agent_selected_image()
+        snapshot = self.snapshots.get(self.snapshot_key(container_key)) if self.snapshots else None
+        container["from_snapshot"] = bool(
+            allowed and
+            (self.from_snapshot or self.settings.start_from_snapshot) and
+            snapshot and
+            image_name and
+            snapshot["source_image"] == image_name and
+            self.image_index.exists(snapshot["image"]))
+        return container["from_snapshot"]
+
+    def choose_snapshots(self):
+        """Decide for the master and then every agent, before any of them start"""
+        for container_key in ["master"] + self.agents():
+            self.choose_snapshot(container_key)
+
+    def container_image(self, container_key, image_name):
+        """The snapshot of `container_key` if it was chosen, otherwise `image_name`"""
+        container = self.container[container_key]
+        if container["from_snapshot"]:
+            image_name = self.snapshots.get(self.snapshot_key(container_key))["image"]
+            self.logger.info("fast starting {name} from snapshot {image}".format(
+                name=container["name"], image=image_name))
+        return image_name
+
+    @Tracer.traced
+    def take_snapshot(self):
+        """
+        Commit the running master and agents to local images so they can be
+        fast started later, returns True on success
+        """
+        if self.pe_status() != "running":
+            self.notifier.error("PE must be running to take a snapshot")
+            return False
+
+        status = True
+        for container_key in ["master"] + self.agents():
+            container = self.container[container_key]
+            if not self.container_alive(container):
+                continue
+
+            previous = self.snapshots.get(self.snapshot_key(container_key)) or {}
+            if container["from_snapshot"]:
+                # keep what we know about the original image and boot
+                source_image = previous.get("source_image")
+                boot_seconds = previous.get("boot_seconds")
+            else:
+                source_image = self.ll_cli.inspect_container(container["name"])["Config"]["Image"]
+                boot_seconds = self.boot_duration
+
+            # the cached login environment belongs to this container, not
+            # to whatever is started from the snapshot
+            self.docker_exec(container, "rm -f " + self.PIPELINE_ENV_FILE)
+
+            started = time.time()
+            self.logger.info("committing {name} to {image}...".format(
+                name=container["name"], image=self.snapshot_image(container_key)))
+            try:
+                self.ll_cli.commit(
+                    container["name"],
+                    repository=self.SNAPSHOT_REPO,
+                    tag=self.snapshot_key(container_key),
+                    message="pe_kit snapshot of " + source_image)
+            except docker.errors.APIError as e:
+                self.logger.exception(e)
+                self.notifier.error("Unable to snapshot {name}: {error}".format(
+                    name=container["name"], error=e.explanation or e.message))
+                status = False
+                continue
+
+            self.snapshots.put(self.snapshot_key(container_key), {
+                "image": self.snapshot_image(container_key),
+                "source_image": source_image,
+                "created": time.time(),
+                "boot_seconds": boot_seconds,
+            })
+            self.logger.info("...snapshot of {name} took {elapsed:.1f}s".format(
+                name=container["name"], elapsed=time.time() - started))
+
+        if self.image_index:
+            self.image_index.invalidate()
+        return status
+
+    def report_time_saved(self):
+        """tell the user how much faster booting from a snapshot was"""
+        snapshot = self.snapshots.get(self.snapshot_key("master")) or {}
+        boot_seconds = snapshot.get("boot_seconds")
+        if boot_seconds:
+            self.notifier.info(
+                "Started from snapshot in {duration:.0f}s, {saved:.0f}s faster than booting\n"
+                "from scratch ({boot_seconds:.0f}s)".format(
+                    duration=self.boot_duration,
+                    saved=boot_seconds - self.boot_duration,
+                    boot_seconds=boot_seconds))
+        else:
+            self.logger.info("started from snapshot in {duration:.0f}s".format(
+                duration=self.boot_duration))
+
+    def start_onceover_sync(self):
+        """Start copying the onceover control repo into the master"""
+        if self.onceover_sync:
+            # new master, send everything again
+            self.onceover_sync.resync()
+        else:
+            self.onceover_sync = OnceoverSync(
+                self.onceover_dir,
+                self.upload_environment_files,
+                self.delete_environment_files,
+                self.run_puppet_on_agents if self.run_puppet_on_sync else None,
+            )
+            self.onceover_sync.start()
+
+    def upload_environment_files(self, files):
+        """
+        Copy (local path, environment path) pairs into the production
+        environment on the master, returns True on success
+        """
+        return self.upload_files(self.container["master"], files, self.ENVIRONMENT_DIR)
+
+    def delete_environment_files(self, paths):
+        """
+        Remove paths relative to the production environment from the master,
+        returns True on success
+        """
+        return self.bash_exec(self.container["master"], "rm -rf " + " ".join(
+            pipes.quote(self.ENVIRONMENT_DIR + "/" + path) for path in paths)) == 0
+
+    def run_puppet_on_agents(self):
+        for container_key in self.agents():
+            container = self.container[container_key]
+            if self.container_alive(container):
+                self.run_puppet(container)
+
+    @Tracer.traced
+    def start_container(self, container, image_name):
+        status = False
+        if self.container_alive(container):
+            status = True
+        else:
+            if image_name:
+                self.logger.info("Starting container {name} using {image}".format(
+                    name=container["name"],
+                    image=image_name
+                ))
+                port_bindings_func = getattr(self, container["port_bindings_func"])
+                port_bindings = port_bindings_func()
+                resource_limits_func = getattr(self, container["resource_limits_func"])
+                resource_limits = resource_limits_func()
+                self.logger.info("Using the {profile} resource profile for {name}".format(
+                    profile=self.resource_profile(), name=container["name"]))
+
+                volumes = [
+                    '/sys/fs/cgroup',
+                ]
+                volume_map = {
+                    '/sys/fs/cgroup': {
+                        'bind': '/sys/fs/cgroup',
+                        'mode': 'ro',
+                    },
+                }
+                if self.settings.shared_dir:
+                    shared_dir_path = os.path.abspath(
+                        os.path.expanduser('~') + '/' + self.settings.shared_dir)
+                    if not os.path.exists(shared_dir_path):
+                        os.mkdir(shared_dir_path)
+                    volume_map[os.path.abspath(shared_dir_path)] = {
+                        'bind': '/shared',
+                        'mode': 'rw',
+                    }
+                    volumes.append('/shared')
+
+                if self.onceover_dir and not self.sync_onceover:
+
+                    # /testcase
+                    volume_map[os.path.abspath(self.onceover_dir)] = {
+                        'bind': '/testcase',
+                        'mode': 'ro',
+                    }
+                    volumes.append("/testcase")
+
+                    # /etc/puppetlabs/code/environments/production/modules
+                    volume_map[os.path.abspath(self.onceover_dir) + "/.onceover/etc/puppetlabs/code/environments/production/modules"] = {
+                        'bind': '/etc/puppetlabs/code/environments/production/modules',
+                        'mode': 'ro',
+                    }
+                    volumes.append("/etc/puppetlabs/code")
+
+                    # /etc/puppetlabs/environments/production/manifests/site.pp (mock takes precidence)
+                    volume_map[
+                        Utils.first_existing_file([
+                            os.path.abspath(self.onceover_dir) + "/spec/site.pp",
+                            os.path.abspath(self.onceover_dir) + "/manifests/site.pp"]
+                        )
+                    ] = {
+                        'bind': '/etc/puppetlabs/code/environments/production/manifests/site.pp',
+                        'mode': 'ro',
+                    }
+                    volumes.append("/etc/puppetlabs/code/environments/production/manifests/site.pp")
+
+                    # /etc/puppetlabs/environments/production/hiera.yaml
+                    volume_map[
+                        Utils.first_existing_file([
+                            os.path.abspath(self.onceover_dir) + "/spec/hiera.yaml",
+                            os.path.abspath(self.onceover_dir) + "/hiera.yaml"]
+                        )
+                    ] = {
+                        'bind': '/etc/puppetlabs/code/environments/production/hiera.yaml',
+                        'mode': 'ro',
+                    }
+                    volumes.append("/etc/puppetlabs/code/environments/production/hiera.yaml")
+
+                    # /etc/puppetlabs/environments/production/environment.conf
+                    volume_map[os.path.abspath(self.onceover_dir) + "/environment.conf"] = {
+                        'bind': '/etc/puppetlabs/code/environments/production/environment.conf',
+                        'mode': 'ro',
+                    }
+                    volumes.append("/etc/puppetlabs/code/environments/production/environment.conf")
+
+                    # /etc/puppetlabs/environments/production/scripts
+                    volume_map[os.path.abspath(self.onceover_dir) + "/scripts"] = {
+                        'bind': '/etc/puppetlabs/code/environments/production/scripts',
+                        'mode': 'ro',
+                    }
+                    volumes.append("/etc/puppetlabs/code/environments/production/scripts")
+
+
+                    # /etc/puppetlabs/environments/production/data
+                    volume_map[os.path.abspath(self.onceover_dir) + "/data"] = {
+                        'bind': '/etc/puppetlabs/code/environments/production/data',
+                        'mode': 'ro',
+                    }
+                    volumes.append("/etc/puppetlabs/code/environments/production/data")
+
+                    # /etc/puppetlabs/environments/production/site
+                    volume_map[os.path.abspath(self.onceover_dir) + "/site"] = {
+                        'bind': '/etc/puppetlabs/code/environments/production/site',
+                        'mode': 'ro',
+                    }
+                    volumes.append("/etc/puppetlabs/code/environments/production/site")
+
+                host_limits = dict(
+                    (key, resource_limits[key]) for key in self.HOST_CONFIG_LIMITS if key in resource_limits)
+
+                # security_opt needed to be able to bind mount inside container: https://github.com/moby/moby/issues/16429
+                host_config=self.ll_cli.create_host_config(
+                    cap_add=['SYS_ADMIN', 'SYS_PTRACE', 'NET_ADMIN', 'NET_RAW'],
+                    tmpfs={
+                        '/tmp:exec': '',
+                        '/run':'',
+                        '/run/lock': '',
+                    },
+                    port_bindings=port_bindings,
+                    binds=volume_map,
+                    security_opt=["apparmor:unconfined"],
+                    network_mode=self.network_name(),
+                    **host_limits
+                )
+                networking_config = self.ll_cli.create_networking_config({
+                    self.network_name(): self.ll_cli.create_endpoint_config(
+                        aliases=self.network_aliases(container)),
+                })
+
+                proceed = True
+                try:
+                    proceed = True
+                    self.ensure_network()
+                    container["instance"] = self.ll_cli.create_container(
+                      image=image_name,
+                      name=container["name"],
+                      hostname=container["host"],
+                      detach=True,
+                      volumes = volumes,
+                      ports = port_bindings.keys(),
+                      host_config=host_config,
+                      networking_config=networking_config,
+                      environment={"PE_KIT_PROFILE": self.resource_profile()},
+                      labels={self.STACK_LABEL: self.stack or self.DEFAULT_STACK},
+                    )
+
+                    # must be in place before systemd starts the services
+                    tuning_files = self.tuning_files(resource_limits)
+                    if tuning_files:
+                        self.ll_cli.put_archive(
+                            container["instance"].get("Id"), "/", TarStream([], tuning_files).chunks())
+                except docker.errors.APIError as e:
+                    if e.response.status_code == 409:
+                        self.logger.info(
+                            "Container {name} already exists - starting it".format(
+                                name=container["name"]))
+                        container["instance"] = self.ll_cli.inspect_container(container["name"])
+
+                        # containers from older versions are on the default bridge
+                        if self.network_name() not in container["instance"]["NetworkSettings"]["Networks"]:
+                            self.ll_cli.connect_container_to_network(
+                                container["name"], self.network_name(),
+                                aliases=self.network_aliases(container))
+                    else:
+                        proceed = False
+                        self.logger.error("Unknown Docker error follows")
+                        self.logger.exception(e)
+                        self.notifier.error("Unknown Docker error:  " + str(e.explanation or e.message))
+                if proceed:
+                    id = container["instance"].get('Id')
+                    self.logger.info("starting container " + id)
+                    resp = self.ll_cli.start(container=id)
+                    self.logger.info(container["instance"])
+                    self.munge_urls(container)
+
+                    # URLs may have changed, don't wait for the next probe
+                    if self.pe_status_prober:
+                        self.pe_status_prober.poke()
+
+                    status = True
+            else:
+                self.notifier.error("No image selected, check settings")
+
+        return status
+
+    @Tracer.traced
+    def munge_urls(self, container):
+
+        # inspect the container and get the port mapping
+        container_info = self.ll_cli.inspect_container(container["instance"].get("Id"))
+
+        parsed = urlparse(self.docker_url)
+        self.docker_address = parsed.netloc.split(":")[0]
+
+        for port in container["ports"]:
+            scheme = "https" if port == "443/tcp" else "http"
+
+            container["ports"][port] = container_info["NetworkSettings"]["Ports"][port][0]["HostPort"]
+            container["urls"][port] = parsed._replace(
+                scheme=scheme,
+                netloc="{}:{}".format(parsed.hostname, container["ports"][port])
+            ).geturl()
+        self.logger.info("port mapping: {ports}".format(ports=container["ports"]))
+
+    @Tracer.traced
+    def refresh_images(self):
+        """Update the lists of downloadable and locally available images,
+        then de-duplicate the list and produce a map combining both lists
+        so that the image managment grid can be built.  Docker hub listings
+        come from the cache when we have them, stale listings are
+        revalidated in the background"""
+
+        container_keys = ["agent", "master"]
+        repos = [self.container[container_key]["image_name"] for container_key in container_keys]
+        cached = {}
+        for repo in repos:
+            tags = self.hub_cache.get(repo)
+            if tags is not None:
+                cached[repo] = tags
+
+        if len(cached) == len(repos):
+            self.update_image_lists(container_keys, cached)
+            stale = [repo for repo in repos if not self.hub_cache.fresh(repo)]
+            if stale:
+                threading.Thread(
+                    target=self.revalidate_images, args=[container_keys, cached, stale]).start()
+        else:
+            # nothing to show yet, we have to wait for the hub
+            self.update_image_lists(container_keys, self.docker_hub_image_tags(repos))
+
+    @Tracer.traced
+    def revalidate_images(self, container_keys, cached, stale):
+        """Refresh `stale` repos from the hub and redraw if we got anything"""
+        if self.revalidate_lock.acquire(False):
+            try:
+                self.logger.debug("revalidating hub tags for " + ", ".join(stale))
+                hub_tags = self.docker_hub_image_tags(stale)
+                if hub_tags:
+                    cached = dict(cached)
+                    cached.update(hub_tags)
+                    self.update_image_lists(container_keys, cached)
+            finally:
+                self.revalidate_lock.release()
+
+    @Tracer.traced
+    def update_image_lists(self, container_keys, hub_tags):
+        """Combine local images with the tags listed on the hub and flag the GUI to redraw"""
+        with self.images_lock:
+            self.update_available = False
+
+            # one call to the daemon for the whole refresh
+            if self.image_index:
+                self.image_index.refresh()
+
+            for container_key in container_keys:
+                container = self.container[container_key]
+                container["local_images"], newest_local = self.update_local_images(container)
+                downloadable_images, newest_downloadable = self.update_downloadable_images(
+                    container, hub_tags.get(container["image_name"]))
+
+                # set flag here and pick it up in the render code
+                if newest_downloadable > newest_local:
+                    self.update_available = True
+
+                container["images"] = self.combine_image_list(container["local_images"], downloadable_images)
+            self.logger.debug("marking initial_setup_complete")
+
+            # flag to indicate we have been setup at least ONCE after startup
+            self.inital_setup_complete.set()
+
+            # flag to indicate the GUI should be refreshed (gets set false after repaint)
+            self.images_refreshed = True
+
+    def combine_image_list(self, local_images, downloadable_images):
+        # now combine into an array of hashes
+        images = []
+        for image_name in downloadable_images:
+            images.append({
+              "name": image_name,
+              "status": "downloadable",
+              "selected": False
+            })
+
+        for image_name in local_images:
+            images.append({
+              "name": image_name,
+              "status": "local",
+              "selected": False
+            })
+        return images
+
+
+    @Tracer.traced
+    def update_local_images(self, container):
+        """
+        re-create the list of locally downloaded images that are ready to
+        run.  Updates the self.local_images array to be a list of tags
+        present locally
+        """
+        local_images = []
+        if self.image_index is not None:
+            local_images = self.image_index.tags_with_prefix(container["image_name"])
+            local_images.sort(reverse=True)
+
+            # move any 3.8x images to the end of the list otherwise they
+            # will have been sorted to the start of the list
+            i = 0
+            while i < len(local_images):
+                # move any images not starting with :201x to the end of the list
+                # should be good for 4 years...
+                if ":201" not in local_images[0]:
+                    local_images.append(local_images.pop(0))
+                i += 1
+
+        if len(local_images):
+            newest_image = local_images[0]
+        else:
+            newest_image = None
+        self.logger.info("Found {count} local images for {image_name}".format(
+            count=len(local_images),
+            image_name=container["image_name"]
+        ))
+        return local_images, newest_image
+
+
+    @Tracer.traced
+    def docker_hub_image_tags(self, repos):
+        """Get the lists of tags for the given images on docker hub, returns a dict of repo -> tags"""
+        result = {}
+        if self.settings.hub_username and self.settings.hub_password:
+            if not self.hub:
+                self.hub = docker_hub.DockerHubClient(
+                    self.settings.hub_address,
+                    self.settings.hub_username,
+                    self.settings.hub_password,
+                )
+                Tracer().trace_session(self.hub.session, "hub")
+            try:
+                result = self.hub.tags_for_repos(repos)
+                self.hub_cache.put(result)
+            except docker_hub.DockerHubLoginError as e:
+                self.logger.error(str(e))
+                self.notifier.error("Unable to obtain Docker Hub token, check connectivity and username/password")
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                self.logger.exception(e)
+                self.logger.error("failed to reach docker hub - no internet?")
+            except requests.exceptions.HTTPError as e:
+                self.logger.exception(e)
+                self.logger.error("Error from docker hub - image accessible and hub up?")
+        else:
+            self.notifier.error("Please enter your Docker Hub username and password on the settings screen")
+
+        return result
+
+
+    # images available for download
+    def update_downloadable_images(self, container, images):
+        """
+        re-create the list of image tags available for download from the
+        tags docker hub listed in `images`.  Returns a list of the available
+        tags (strings) and the newest one
+        """
+        self.logger.debug("checking for remote images")
+        downloadable_images = []
+        if images:
+            for tags in images:
+                # if image is already downloaded, don't list it as available for download
+                image_name = container["image_name"] + ":" + tags["name"]
+                if not self.tag_exists_locally(image_name):
+                    downloadable_images.append(image_name)
+            downloadable_images.sort(reverse=True)
+        else:
+            self.logger.error("No tags from docker hub for {image_name} - image accessible and hub up?".format(
+                image_name=container["image_name"]))
+
+        if len(downloadable_images):
+            newest_image = downloadable_images[0]
+        else:
+            newest_image = None
+
+        self.logger.debug("finished checking remote images")
+        return downloadable_images, newest_image
+
+    # test if a tag has already been downloaded
+    def tag_exists_locally(self, image_name):
+        """determine if a pattern and tag exists locallay"""
+        found = self.image_index.exists(image_name)
+        self.logger.debug("image {image_name} local={found}".format(
+                image_name=image_name,found=found)
+        )
+
+        return found
+
+    @Tracer.traced
+    def run_puppet(self, container):
+        """Run puppet on the master or agent and record a report of the run"""
+        started = time.time()
+        exit_code = self.docker_exec(container, "puppet agent --detailed-exitcodes -t")
+        report = {
+            "time": started,
+            "container": container["name"],
+            "exit_code": exit_code,
+            "duration": time.time() - started,
+        }
+        report.update(self.puppet_run_summary(container, started))
+        self.logger.info("puppet run on {container} exited {exit_code}: {summary}".format(
+            container=container["name"], exit_code=exit_code, summary=RunReports.summary(report)))
+        if self.run_reports:
+            self.run_reports.add(report)
+        return exit_code
+
+    @Tracer.traced
+    def puppet_run_summary(self, container, started):
+        """
+        timings and resource counts from the puppet run begun at `started`,
+        empty if it didn't write a summary - runs that fail early (cert or
+        connection errors) leave the previous run's in place
+        """
+        exit_code, output = self.exec_output(container, [
+            self.PUPPET_RUBY, "-ryaml", "-rjson", "-e",
+            "puts YAML.load_file(ARGV[0]).to_json", self.LAST_RUN_SUMMARY])
+        summary = {}
+        if exit_code == 0:
+            # the json is the last line, anything before is ruby complaining
+            try:
+                parsed = json.loads(output[-1])
+                last_run = (parsed.get("time") or {}).get("last_run") or 0
+                if last_run >= int(started):
+                    summary = RunReports.from_summary(parsed)
+                else:
+                    self.logger.info("no puppet run summary for the run on {container}, last one is from {age:.0f}s earlier".format(
+                        container=container["name"], age=started - last_run))
+            except (IndexError, ValueError, AttributeError) as e:
+                self.logger.error("unable to read puppet run summary: " + str(e))
+        return summary
+
+    def disable_puppet(self, container):
+        """Disable the Puppet Agent"""
+        return self.docker_exec(container, "puppet agent --disable")
+
+    @Tracer.traced
+    def wait_pe_ready(self, timeout=None):
+        """
+        wait for PE to finish booting, at most `timeout` seconds (the
+        `pe_ready_timeout` setting by default).  Returns False if we are
+        shutting down or timed out
+        """
+        if timeout is None:
+            timeout = self.settings.pe_ready_timeout
+        ready, waited = Utils.wait_event(
+            self.pe_status_prober.ready,
+            timeout,
+            description="PE running",
+            running=lambda: self.running,
+        )
+        if not ready and self.running:
+            self.notifier.error(
+                "PE was not ready after {waited:.0f}s, check the master container's logs "
+                "(pe_ready_timeout in ~/.pe_kit.cfg sets how long to wait)".format(waited=waited))
+        return ready
+
+    @Tracer.traced
+    def csrs_pending(self, hosts):
+        """True if puppetserver has received certificate requests from all `hosts`"""
+        return self.bash_exec(self.container["master"],
+            "(puppetserver ca list; puppet cert list) > /tmp/pe_kit_csrs 2>/dev/null; "
+            "for host in {hosts} ; do grep -q $host /tmp/pe_kit_csrs || exit 1 ; done".format(
+                hosts=" ".join(hosts)
+            )) == 0
+
+    @Tracer.traced
+    def sign_agent_certs(self, hosts):
+        """Sign the certificates of `hosts` on the master in one go, returns True on success"""
+        if not hosts:
+            self.logger.info("no agent certificates need signing")
+            return True
+
+        # wait for certs to arrive in puppetserver
+        pending, waited = Utils.wait_for(
+            lambda: self.csrs_pending(hosts),
+            self.CSR_TIMEOUT,
+            description="CSRs from " + ", ".join(hosts),
+            running=lambda: self.running,
+        )
+        if not pending:
+            # sign what we have, the missing agents will fail their puppet run
+            self.logger.error("not all certificate requests arrived after {waited:.0f}s".format(
+                waited=waited))
+
+        self.logger.info("signing {count} agent certs on master...".format(count=len(hosts)))
+        exit_code = self.bash_exec(self.container["master"],
+            "puppetserver ca sign --certname {certnames} || puppet cert sign {hosts}".format(
+                certnames=",".join(hosts),
+                hosts=" ".join(hosts),
+            ))
+        return pending and exit_code == 0
+
+    @Tracer.traced
+    def install_licence(self):
+        """Install user-provided licence file on the puppet master"""
+
+        self.logger.debug("Installing licence file...")
+
+        if os.path.isfile(self.settings.licence_file):
+            # renamed on the way so it ends up with the name PE expects
+            self.upload_file(
+                self.container["master"],
+                self.settings.licence_file,
+                "/etc/puppetlabs",
+                arcname="license.key",
+            )
+        else:
+             self.notifier.error(
+                "Specified licence key file %(licence_file)s does not exist"
+                % {'licence_file': self.settings.licence_file})
+
+    def upload_file(self, container, local_path, remote_path, arcname=None):
+        """Upload a file or directory to `remote_path` on `container`, optionally renaming it"""
+        return self.upload_files(
+            container, [(local_path, arcname or os.path.basename(local_path))], remote_path)
+
+    @Tracer.traced
+    def upload_files(self, container, files, remote_path):
+        """
+        Upload (local path, path in archive) pairs - files or whole
+        directories - to `remote_path` on `container` as one tarball.  The
+        tarball is streamed as it is built so large trees are never held in
+        memory
+        """
+        container_name = container["name"]
+        self.logger.debug("Uploading {count} paths to {container_name} at {remote_path}".format(
+            count=len(files), container_name=container_name, remote_path=remote_path))
+
+        # docker python api only provides a way to upload files via tarballs
+        uploaded = self.ll_cli.put_archive(container_name, remote_path, TarStream(files).chunks())
+        if not uploaded:
+            self.logger.error("upload to {container_name}:{remote_path} failed".format(
+                container_name=container_name, remote_path=remote_path))
+        return uploaded
+
+    @Tracer.traced
+    def agent_provision(self, container_key="agent"):
+        """Install puppet on agent - you need to accept and run puppet manually"""
+
+        # curl script
+        return self.bash_exec(self.container[container_key], self.curl_command())
+
+    @Tracer.traced
+    def docker_exec(self, container, cmd):
+        """run a docker command on a container and return the exit status"""
+        container_name = container["name"]
+        self.logger.debug("container {container_name} running: {cmd}...".format(
+            container_name=container_name,
+            cmd=cmd,
+        ))
+        exec_instance = self.ll_cli.exec_create(
+            container=container_name,
+            cmd=cmd,
+        )
+        for line in self.exec_lines(exec_instance):
+            self.exec_log.append(container_name, line)
+        exit_code = self.ll_cli.exec_inspect(exec_instance["Id"])['ExitCode']
+        self.logger.debug("...done! result: {exit_code}".format(
+            exit_code=exit_code))
+        return exit_code
+
+    @Tracer.traced
+    def exec_pipeline(self, container, steps, stop_on_error=True):
+        """
+        Run `steps` - a list of (name, shell command) - in a single exec
+        session on `container` with the puppet login environment.  Unless
+        `stop_on_error` is False we stop at the first failing step.  Returns
+        a list of {"name", "exit_code", "ms"} for each step that ran
+        """
+        container_name = container["name"]
+        cmd = ["bash", "-c", self.PIPELINE_RUNNER.format(marker=self.PIPELINE_MARKER),
+               "pe_kit_pipeline", self.PIPELINE_ENV_FILE, "true" if stop_on_error else "false"]
+        for name, step_cmd in steps:
+            cmd.extend([name, step_cmd])
+        self.logger.debug("container {container_name} running pipeline: {names}...".format(
+            container_name=container_name,
+            names=", ".join(name for name, step_cmd in steps),
+        ))
+
+        exec_instance = self.ll_cli.exec_create(container=container_name, cmd=cmd)
+        results = []
+        for line in self.exec_lines(exec_instance):
+            if line.startswith(self.PIPELINE_MARKER):
+                results.append(json.loads(line[len(self.PIPELINE_MARKER):]))
+            elif line:
+                self.exec_log.append(container_name, line)
+
+        for result in results:
+            self.logger.info("container {container_name} step {name} exited {exit_code} in {ms}ms".format(
+                container_name=container_name, **result))
+        return results
+
+    @Tracer.traced
+    def exec_output(self, container, cmd):
+        """run a command on a container, returns the exit status and its output as a list of lines"""
+        exec_instance = self.ll_cli.exec_create(container=container["name"], cmd=cmd)
+        output = [line for line in self.exec_lines(exec_instance) if line]
+        exit_code = self.ll_cli.exec_inspect(exec_instance["Id"])['ExitCode']
+        return exit_code, output
+
+    def exec_lines(self, exec_instance):
+        """Generator of the output of a created exec, line by line"""
+        buffered = ""
+        for chunk in self.ll_cli.exec_start(exec_instance, stream=True):
+            if not self.running:
+                raise Exception("Aborting command because quit/cancel!")
+
+            # chunks don't respect line endings
+            lines = (buffered + chunk).split("\n")
+            buffered = lines.pop()
+            for line in lines:
+                yield line
+        if buffered:
+            yield buffered
+
+    def bash_exec(self, container, cmd):
+        """run a shell command with the puppet login environment, returns the exit status"""
+        results = self.exec_pipeline(container, [("cmd", cmd)])
+
+        # no result means the runner itself failed
+        return results[0]["exit_code"] if results else -1
+
+    def clean_certs(self):
+        """Delete agent certs from master and all certs from agents to allow reprovisioning"""
+        agent_cleaned = False
+        master_cleaned = False
+        hosts = [self.container[container_key]["host"] for container_key in self.agents()]
+
+        # purge agent certs from master
+        if self.container_alive(self.container["master"]):
+            if self.pe_status() == "running":
+                # can only purge from puppet console if master is running or we get
+                # PDB error
+                cmd = "puppet node purge {host}"
+            else:
+                # no PDB..? we can still make reprovision work by doing cert clean...
+                # run the older PE command and fallback to the newer one if it fails
+                cmd = "puppet cert clean {host} || puppetserver ca clean --certname {host}"
+            # one session for all agents, carry on if one wasn't known
+            self.exec_pipeline(
+                self.container["master"],
+                [("clean_" + host, cmd.format(host=host)) for host in hosts],
+                stop_on_error=False,
+            )
+            master_cleaned = True
+
+        # agents
+        for container_key in self.agents():
+            if self.container_alive(self.container[container_key]):
+                cmd = "rm -rf /etc/puppetlabs/puppet/ssl"
+                self.docker_exec(self.container[container_key], cmd)
+                agent_cleaned = True
+
+        return master_cleaned, agent_cleaned
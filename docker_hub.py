@@ -0,0 +1,171 @@
+#
+# Copyright 2017 Geoff Williams for Declarative Systems PTY LTD
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+import threading
+import time
+import json
+import base64
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class DockerHubLoginError(Exception):
+    """Raised when docker hub refuses our username/password"""
+    pass
+
+
+class DockerHubClient:
+    """
+    DockerHubClient
+
+    Talk to the docker hub API over a single pooled session.  The login
+    token is cached until it expires, tag listings follow pagination and
+    are revalidated with ETags so an unchanged listing costs one cheap
+    request
+    """
+
+    logger = logging.getLogger(__name__)
+
+    TIMEOUT = 5
+
+    # connections to keep open to the hub
+    POOL_SIZE = 4
+
+    # tags to request per page
+    PAGE_SIZE = 100
+
+    # how long to trust a token that doesn't tell us when it expires
+    TOKEN_TTL = 300
+
+    # renew tokens this many seconds before they expire
+    TOKEN_MARGIN = 30
+
+    def __init__(self, address, username, password):
+        self.address = address.rstrip("/")
+        self.username = username
+        self.password = password
+        self.token = None
+        self.token_expires = 0
+
+        # url -> (etag, results) for the last listing of each repo
+        self.etags = {}
+        self.lock = threading.Lock()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.POOL_SIZE, pool_maxsize=self.POOL_SIZE)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    @staticmethod
+    def token_expiry(token):
+        """Read the `exp` claim from a JWT, or None if it can't be decoded"""
+        try:
+            payload = token.split(".")[1]
+            payload += "=" * (-len(payload) % 4)
+            return json.loads(base64.urlsafe_b64decode(str(payload)))["exp"]
+        except (IndexError, KeyError, ValueError, TypeError):
+            return None
+
+    def login(self):
+        """Obtain a fresh token, raising DockerHubLoginError if refused"""
+        r = self.session.post(
+            self.address + '/v2/users/login/',
+            json={'password': self.password, 'username': self.username},
+            headers={
+              'Accept': 'application/json',
+              'Content-Type': 'application/json'},
+            timeout=self.TIMEOUT)
+        if r.status_code != requests.codes.ok:
+            raise DockerHubLoginError('docker hub login failed: ' + str(r))
+
+        token = r.json()['token']
+        expires = self.token_expiry(token) or time.time() + self.TOKEN_TTL
+        with self.lock:
+            self.token = 'JWT ' + token
+            self.token_expires = expires - self.TOKEN_MARGIN
+
+    def auth_header(self):
+        with self.lock:
+            valid = self.token and time.time() < self.token_expires
+        if not valid:
+            self.login()
+        return {'Authorization': self.token}
+
+    def get(self, url, headers=None):
+        """GET with our token, logging in again if the hub rejects it"""
+        all_headers = dict(headers or {})
+        all_headers.update(self.auth_header())
+        r = self.session.get(url, headers=all_headers, timeout=self.TIMEOUT)
+        if r.status_code == requests.codes.unauthorized:
+            self.login()
+            all_headers.update(self.auth_header())
+            r = self.session.get(url, headers=all_headers, timeout=self.TIMEOUT)
+        return r
+
+    def tags(self, repo):
+        """Get the list of tags for a given image on docker hub"""
+        url = "{address}/v2/repositories/{repo}/tags/?page_size={page_size}".format(
+            address=self.address,
+            repo=repo,
+            page_size=self.PAGE_SIZE,
+        )
+
+        # new tags show up on the first page, so if that hasn't changed
+        # nothing has
+        with self.lock:
+            etag, cached = self.etags.get(url, (None, None))
+        r = self.get(url, {'If-None-Match': etag} if etag else {})
+        if r.status_code == requests.codes.not_modified:
+            self.logger.debug("tags for {repo} unchanged".format(repo=repo))
+            return list(cached)
+
+        r.raise_for_status()
+        page = r.json()
+        results = page['results']
+        etag = r.headers.get('ETag')
+        while page.get('next'):
+            r = self.get(page['next'])
+            r.raise_for_status()
+            page = r.json()
+            results.extend(page['results'])
+
+        if etag:
+            with self.lock:
+                self.etags[url] = (etag, results)
+
+        self.logger.debug("found {count} tags for {repo}".format(count=len(results), repo=repo))
+        return list(results)
+
+    def tags_for_repos(self, repos):
+        """Fetch the tags for several repos at once, returns a dict of repo -> tags"""
+        results = {}
+        errors = []
+
+        def fetch(repo):
+            try:
+                results[repo] = self.tags(repo)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=fetch, args=[repo]) for repo in repos]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        if errors:
+            raise errors[0]
+        return results
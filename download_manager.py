@@ -0,0 +1,140 @@
+#
+# Copyright 2017 Geoff Williams for Declarative Systems PTY LTD
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+import threading
+import heapq
+import itertools
+
+
+class DownloadManager:
+    """
+    DownloadManager
+
+    Queue of image downloads run by a fixed number of worker threads so
+    that we never have more than `max_concurrent` pulls fighting over the
+    disk and network.  Lower priorities run first, downloads with the same
+    priority run in the order they were queued.  The status of each
+    download is kept under a lock so the GUI can poll it cheaply
+    """
+
+    logger = logging.getLogger(__name__)
+
+    # statuses of downloads that haven't finished
+    ACTIVE = ["queued", "downloading"]
+
+    def __init__(self, download_func, max_concurrent=1):
+        # called with the image name to do the actual download, returns
+        # True on success
+        self.download_func = download_func
+        self.max_concurrent = max_concurrent
+
+        self.queue = []
+        self.sequence = itertools.count()
+        self.condition = threading.Condition()
+        self.running = True
+        self.workers = []
+
+        # image name -> {"status": str, "priority": priority, "progress": object}
+        self.downloads = {}
+
+    def start(self):
+        for i in range(self.max_concurrent):
+            thread = threading.Thread(target=self.worker)
+            thread.start()
+            self.workers.append(thread)
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            for image_name in self.downloads:
+                if self.downloads[image_name]["status"] in self.ACTIVE:
+                    self.downloads[image_name]["status"] = "cancelled"
+            self.condition.notify_all()
+
+    def enqueue(self, image_name, priority=0):
+        """Queue a download, returns False if its already queued or downloading"""
+        with self.condition:
+            if self.active(image_name):
+                self.logger.info(
+                    "Already downloading {image_name}, refusing duplicate download".format(
+                        image_name=image_name))
+                return False
+
+            self.downloads[image_name] = {
+                "status": "queued",
+                "priority": priority,
+                "progress": None,
+            }
+            heapq.heappush(self.queue, (priority, next(self.sequence), image_name))
+            self.logger.info("queued download of {image_name} (priority {priority})".format(
+                image_name=image_name, priority=priority))
+            self.condition.notify()
+        return True
+
+    def cancel(self, image_name):
+        """Cancel a queued or running download"""
+        with self.condition:
+            if self.active(image_name):
+                self.downloads[image_name]["status"] = "cancelled"
+
+    def cancelled(self, image_name):
+        """True if a running download should stop"""
+        with self.condition:
+            return not self.running or self.downloads.get(image_name, {}).get("status") == "cancelled"
+
+    def active(self, image_name):
+        """True if `image_name` is queued or downloading"""
+        with self.condition:
+            return self.downloads.get(image_name, {}).get("status") in self.ACTIVE
+
+    def status(self, image_name):
+        """Copy of the status of a download or None if we never saw it"""
+        with self.condition:
+            download = self.downloads.get(image_name)
+            return dict(download) if download else None
+
+    def set_progress(self, image_name, progress):
+        with self.condition:
+            if image_name in self.downloads:
+                self.downloads[image_name]["progress"] = progress
+
+    def next_download(self):
+        """Block until there is something to download, returns None when stopping"""
+        with self.condition:
+            while self.running:
+                while self.queue:
+                    priority, sequence, image_name = heapq.heappop(self.queue)
+
+                    # skip downloads cancelled while they were queued
+                    if self.downloads[image_name]["status"] == "queued":
+                        self.downloads[image_name]["status"] = "downloading"
+                        return image_name
+                self.condition.wait()
+        return None
+
+    def worker(self):
+        while True:
+            image_name = self.next_download()
+            if image_name is None:
+                break
+            try:
+                ok = self.download_func(image_name)
+            except Exception as e:
+                self.logger.exception(e)
+                ok = False
+            with self.condition:
+                if self.downloads[image_name]["status"] == "downloading":
+                    self.downloads[image_name]["status"] = "done" if ok else "failed"
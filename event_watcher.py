@@ -0,0 +1,90 @@
+#
+# Copyright 2017 Geoff Williams for Declarative Systems PTY LTD
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+import threading
+import time
+from lazy_module import LazyModule
+
+docker = LazyModule("docker", "docker.errors")
+requests = LazyModule("requests", "requests.exceptions")
+
+
+class EventWatcher:
+    """
+    EventWatcher
+
+    Daemon thread following the docker events matching `filters`,
+    resubscribing whenever the stream drops.  Each decoded event is passed
+    to `on_event`.  `on_subscribed` is called once the stream is open,
+    before any events are read, and `on_dropped` every time the stream
+    ends - this is where owners fall back to polling until the daemon lets
+    us subscribe again
+    """
+
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, ll_cli, filters, on_event, on_subscribed=None, on_dropped=None,
+                 description="docker events", interval=1):
+        self.ll_cli = ll_cli
+        self.filters = filters
+        self.on_event = on_event
+        self.on_subscribed = on_subscribed
+        self.on_dropped = on_dropped
+
+        # what the stream carries, for log messages
+        self.description = description
+
+        # seconds between attempts to resubscribe
+        self.interval = interval
+        self.running = True
+        self.stream = None
+
+    def run(self):
+        while self.running:
+            try:
+                self.stream = self.ll_cli.events(filters=self.filters, decode=True)
+                if self.on_subscribed:
+                    self.on_subscribed()
+                for event in self.stream:
+                    if not self.running:
+                        break
+                    self.on_event(event)
+            except (requests.exceptions.ConnectionError,
+                    requests.exceptions.ReadTimeout,
+                    docker.errors.APIError) as e:
+                if self.running:
+                    self.logger.error("{description} stream dropped: {error}".format(
+                        description=self.description, error=e))
+            except Exception as e:
+                # closing the stream from stop() can surface as almost
+                # anything, otherwise (eg urllib3 ProtocolError when dockerd
+                # dies mid-stream) carry on rather than losing the thread
+                if self.running:
+                    self.logger.exception("{description} stream failed: {error}".format(
+                        description=self.description, error=e))
+
+            if self.on_dropped:
+                self.on_dropped()
+            if self.running:
+                time.sleep(self.interval)
+
+    def start(self):
+        threading.Thread(target=self.run).start()
+
+    def stop(self):
+        self.running = False
+        if self.stream is not None and hasattr(self.stream, "close"):
+            self.stream.close()
@@ -0,0 +1,109 @@
+#
+# Copyright 2017 Geoff Williams for Declarative Systems PTY LTD
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+import threading
+import itertools
+from collections import deque
+
+
+class ExecLog:
+    """
+    ExecLog
+
+    Output of commands run in our containers, kept as the last `max_lines`
+    lines per container so a long puppet run can't eat all our memory.
+    Every line gets a sequence number so readers can ask for what is new
+    since they last looked, subscribers are called with each line as it
+    arrives (from the thread running the command)
+    """
+
+    logger = logging.getLogger(__name__)
+
+    MAX_LINES = 2000
+
+    def __init__(self, max_lines=MAX_LINES):
+        self.max_lines = max_lines
+        self.condition = threading.Condition()
+        self.sequence = itertools.count(1)
+        self.last_seq = 0
+        self.subscribers = []
+
+        # container name -> deque of (seq, line)
+        self.buffers = {}
+
+    def append(self, container_name, line):
+        with self.condition:
+            seq = next(self.sequence)
+            if container_name not in self.buffers:
+                self.buffers[container_name] = deque(maxlen=self.max_lines)
+            self.buffers[container_name].append((seq, line))
+            self.last_seq = seq
+            subscribers = list(self.subscribers)
+            self.condition.notify_all()
+
+        for subscriber in subscribers:
+            try:
+                subscriber(container_name, line)
+            except Exception as e:
+                self.logger.exception(e)
+
+    def subscribe(self, callback):
+        """call `callback(container_name, line)` for each new line"""
+        with self.condition:
+            self.subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        with self.condition:
+            if callback in self.subscribers:
+                self.subscribers.remove(callback)
+
+    def lines(self, container_name):
+        """the buffered output of `container_name`, oldest first"""
+        with self.condition:
+            return [line for seq, line in self.buffers.get(container_name, [])]
+
+    def since(self, seq=0):
+        """
+        Lines from all containers newer than `seq` as a list of
+        (container_name, line) in the order they arrived, and the sequence
+        number to pass next time
+        """
+        with self.condition:
+            new = []
+            for container_name in self.buffers:
+                new.extend(
+                    (line_seq, container_name, line)
+                    for line_seq, line in self.buffers[container_name] if line_seq > seq)
+            last_seq = self.last_seq
+        new.sort()
+        return [(container_name, line) for line_seq, container_name, line in new], last_seq
+
+    def follow(self, container_name, running=None, timeout=1):
+        """
+        Generator of new lines from `container_name` as they arrive.  Stops
+        when `running()` returns False, checking at least every `timeout`
+        seconds
+        """
+        with self.condition:
+            seq = self.last_seq
+        while running is None or running():
+            with self.condition:
+                buffered = self.buffers.get(container_name, [])
+                new = [(line_seq, line) for line_seq, line in buffered if line_seq > seq]
+                if not new:
+                    self.condition.wait(timeout)
+            for seq, line in new:
+                yield line
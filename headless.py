@@ -0,0 +1,249 @@
+#
+# Copyright 2017 Geoff Williams for Declarative Systems PTY LTD
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Drive the Controller without the GUI (and without importing kivy) so
+# that demo environments can be created from scripts and CI:
+#
+#   pe_kit up          start (and provision) the master and agent
+#   pe_kit down        stop and remove the containers
+#   pe_kit status      show the state of docker, the containers and PE
+#   pe_kit provision   provision the agent against a running master
+#   pe_kit run         run puppet on a container and show the timings
+#   pe_kit report      show or export the history of puppet runs
+#   pe_kit snapshot    save the running containers for `up --from-snapshot`
+#   pe_kit stacks      list the stacks on this docker host
+#   pe_kit benchmark   time booting to a provisioned agent and compare with
+#                      earlier benchmarks
+#
+# Each command works on the default stack unless `--stack NAME` is given
+import logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logging.getLogger("requests").setLevel(logging.WARNING)
+logging.getLogger("urllib3").setLevel(logging.WARNING)
+
+import sys
+import argparse
+import datetime
+from boot_scheduler import BootScheduler
+from pe_status import PeStatusProber
+from controller import Controller
+from run_reports import RunReports
+from benchmark import Benchmark
+from benchmark_results import BenchmarkResults
+from settings import Settings
+from lazy_module import LazyModule
+
+docker = LazyModule("docker", "docker.errors")
+requests = LazyModule("requests", "requests.exceptions")
+
+# non-class logger
+logger = logging.getLogger(__name__)
+
+
+def up(controller, args):
+    controller.docker_connect()
+    controller.add_agents()
+    for container_key in ["master"] + controller.agents():
+        controller.cleanup_container(controller.container[container_key])
+    controller.select_images()
+    status = controller.boot()
+    logger.info("boot timings: {timings}".format(timings=controller.boot_timings))
+    if status:
+        print("PE console: " + (controller.pe_url() or "unknown"))
+    return status
+
+
+def down(controller, args):
+    controller.docker_connect()
+    controller.remove_stack()
+    return True
+
+
+def status(controller, args):
+    """exits non-zero unless docker and PE are both running"""
+    controller.docker_connect()
+    docker_status = controller.daemon_alive()
+    print("docker: " + docker_status)
+    if docker_status != "running":
+        return False
+
+    for container_key in sorted(controller.container):
+        container = controller.container[container_key]
+        uptime = controller.container_alive(container)
+        print("{container_key}: {state}".format(
+            container_key=container_key,
+            state="up {uptime}s".format(uptime=uptime) if uptime else "stopped"))
+
+    controller.attach_containers()
+    if controller.container_alive(controller.container["master"]):
+        controller.pe_status_prober.update()
+    snapshot = controller.pe_status_snapshot()
+    print("pe: {status} ({message})".format(
+        status=snapshot["status"], message=snapshot["message"]))
+    return snapshot["status"] == "running"
+
+
+def provision(controller, args):
+    controller.docker_connect()
+    controller.attach_containers()
+    if not controller.container_alive(controller.container["master"]):
+        logger.error("master container is not running, try `pe_kit up`")
+        return False
+
+    agent_depends = {}
+    scheduler = BootScheduler(controller.BOOT_WORKERS)
+    for container_key in controller.agents():
+        if controller.container_alive(controller.container[container_key]):
+            agent_depends[container_key] = []
+        else:
+            logger.error(container_key + " container is not running, try `pe_kit up`")
+    if not agent_depends:
+        return False
+
+    controller.provision_steps(scheduler, [], agent_depends)
+    return scheduler.run()
+
+
+def run(controller, args):
+    controller.docker_connect()
+    container = controller.container[args.on]
+    if not controller.container_alive(container):
+        logger.error(args.on + " container is not running, try `pe_kit up`")
+        return False
+
+    exit_code = controller.run_puppet(container)
+    report = controller.run_reports.latest(container["name"])
+    print("puppet exited {exit_code}: {summary}".format(
+        exit_code=exit_code, summary=RunReports.summary(report)))
+    return exit_code in (0, 2)
+
+
+def report(controller, args):
+    controller.add_agents()
+    run_reports = RunReports(Settings.REPORTS_FILE)
+    container_name = controller.container[args.on]["name"] if args.on else None
+    if args.export:
+        with open(args.export, "w") as f:
+            run_reports.export(f, "csv" if args.export.endswith(".csv") else "json", container_name)
+        print("exported to " + args.export)
+    else:
+        for run_report in run_reports.history(container_name):
+            print("{time} {container} exit {exit_code}: {summary}".format(
+                time=datetime.datetime.fromtimestamp(run_report["time"]).strftime("%Y-%m-%d %H:%M:%S"),
+                container=run_report["container"],
+                exit_code=run_report["exit_code"],
+                summary=RunReports.summary(run_report)))
+    return True
+
+
+def snapshot(controller, args):
+    controller.docker_connect()
+    controller.attach_containers()
+    controller.pe_status_prober.update()
+    return controller.take_snapshot()
+
+
+def stacks(controller, args):
+    controller.docker_connect()
+    for name, stack in sorted(controller.list_stacks().items()):
+        print("{name}: {containers}".format(
+            name=name,
+            containers=", ".join(
+                "{container} ({status})".format(container=container, status=status)
+                for container, status in sorted(stack["containers"])) or "no containers"))
+        if stack["ports"]:
+            print("  ports: " + ", ".join(
+                "{port}->{host_port}".format(port=port, host_port=host_port)
+                for port, host_port in sorted(stack["ports"].items())))
+    return True
+
+
+def benchmark(controller, args):
+    controller.docker_connect()
+    results = BenchmarkResults(Settings.BENCHMARKS_FILE)
+    bench = Benchmark(controller, results, args.runs, args.label)
+    ok = bench.run()
+
+    baseline = results.baseline(bench.batch, args.baseline)
+    print(BenchmarkResults.report(results.compare(bench.batch, baseline)))
+    if baseline is None:
+        print("no earlier benchmark to compare with")
+    else:
+        print("baseline: {count} runs from {time}".format(
+            count=len(results.history(baseline)),
+            time=datetime.datetime.fromtimestamp(baseline).strftime("%Y-%m-%d %H:%M:%S")))
+
+    if args.export:
+        with open(args.export, "w") as f:
+            results.export(f, "csv" if args.export.endswith(".csv") else "json", bench.batch)
+        print("exported to " + args.export)
+    return ok
+
+
+COMMANDS = {
+    "up": up,
+    "down": down,
+    "status": status,
+    "provision": provision,
+    "run": run,
+    "report": report,
+    "snapshot": snapshot,
+    "stacks": stacks,
+    "benchmark": benchmark,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser("PE_Kit - instant PE (headless)")
+    parser.add_argument("command", choices=sorted(COMMANDS), help="what to do")
+    parser.add_argument("--on", help="container to run puppet on or report for (master, agent, agent2...)")
+    parser.add_argument("--export", help="file to export the report history or benchmark results to (.json or .csv)")
+    parser.add_argument("--runs", type=int, default=1, help="number of times to boot and provision for `benchmark`")
+    parser.add_argument("--label", help="label for this batch of benchmark runs, eg what was changed")
+    parser.add_argument("--baseline", help="compare the benchmark with the newest runs labelled BASELINE instead of the previous runs")
+    Controller.add_arguments(parser)
+    args = parser.parse_args()
+
+    controller = Controller()
+    controller.configure(args)
+    if args.command == "run":
+        args.on = args.on or "agent"
+    if args.on and args.on not in ["master"] + controller.agents():
+        parser.error("unknown container " + args.on)
+
+    # the status prober is normally started with the GUI, we only need it for
+    # waiting on PE to come up
+    controller.pe_status_prober = PeStatusProber(controller.pe_url)
+    if args.command in ["up", "provision", "benchmark"]:
+        controller.pe_status_prober.start()
+
+    try:
+        ok = COMMANDS[args.command](controller, args)
+    except KeyboardInterrupt:
+        logger.error("someone pressed ctrl+c - exit")
+        ok = False
+    except (requests.exceptions.ConnectionError, docker.errors.APIError) as e:
+        print("docker daemon unreachable, is docker running? ({error})".format(error=e))
+        ok = False
+    finally:
+        controller.stop()
+
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,64 @@
+#
+# Copyright 2017 Geoff Williams for Declarative Systems PTY LTD
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+import threading
+import time
+from json_store import JsonStore
+
+
+class HubTagCache:
+    """
+    HubTagCache
+
+    On-disk cache of docker hub tag listings so the images screen can be
+    drawn straight away (and without a network) on startup.  Each repo is
+    stored with the time it was fetched, entries older than `ttl` seconds
+    are still served but should be revalidated
+    """
+
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, path, ttl):
+        self.store = JsonStore(path, "hub cache")
+        self.ttl = ttl
+        self.lock = threading.Lock()
+
+        # repo -> {"tags": [{"name": tag}, ...], "fetched": epoch}
+        self.entries = self.store.load()
+
+    def get(self, repo):
+        """Cached tags for `repo` or None if we have never fetched it"""
+        with self.lock:
+            entry = self.entries.get(repo)
+        return entry["tags"] if entry else None
+
+    def fresh(self, repo):
+        """True if `repo` was fetched less than `ttl` seconds ago"""
+        with self.lock:
+            entry = self.entries.get(repo)
+        return bool(entry) and time.time() - entry["fetched"] < self.ttl
+
+    def put(self, tags):
+        """Store a dict of repo -> tags from the hub"""
+        with self.lock, self.store.locked():
+            self.entries = self.store.load()
+            for repo in tags:
+                self.entries[repo] = {
+                    # only the tag name is used, don't store the rest
+                    "tags": [{"name": tag["name"]} for tag in tags[repo]],
+                    "fetched": time.time(),
+                }
+            self.store.save(self.entries)
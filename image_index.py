@@ -0,0 +1,96 @@
+#
+# Copyright 2017 Geoff Williams for Declarative Systems PTY LTD
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+import threading
+from event_watcher import EventWatcher
+
+
+class ImageIndex:
+    """
+    ImageIndex
+
+    Set of every RepoTag known to the local docker daemon, built from a
+    single `images()` call and reused for all lookups until it is
+    invalidated by a docker image event or by us pulling/deleting an image
+    """
+
+    logger = logging.getLogger(__name__)
+
+    # docker image events that change the set of local tags
+    EVENTS = ["pull", "delete", "tag", "untag", "import", "load"]
+
+    # placeholder docker uses for untagged images
+    UNTAGGED = "<none>:<none>"
+
+    def __init__(self, ll_cli):
+        self.ll_cli = ll_cli
+        self.watcher = EventWatcher(
+            ll_cli,
+            {"type": "image", "event": self.EVENTS},
+            self.process_event,
+            # anything could have happened while we weren't listening
+            on_dropped=self.invalidate,
+            description="docker image events",
+        )
+        self.tags = set()
+        self.valid = False
+        self.lock = threading.Lock()
+
+    def refresh(self):
+        """Rebuild the index from the daemon"""
+        tags = set()
+        for docker_image in self.ll_cli.images():
+            # RepoTags contains all the names by which this image is known
+            for image_alias in docker_image["RepoTags"] or []:
+                if image_alias != self.UNTAGGED:
+                    tags.add(image_alias)
+
+        with self.lock:
+            self.tags = tags
+            self.valid = True
+        self.logger.debug("indexed {count} local image tags".format(count=len(tags)))
+
+    def invalidate(self):
+        """Force a rebuild on next lookup"""
+        with self.lock:
+            self.valid = False
+
+    def ensure(self):
+        if not self.valid:
+            self.refresh()
+
+    def exists(self, image_name):
+        """determine if an image name+tag exists locally"""
+        self.ensure()
+        with self.lock:
+            return image_name in self.tags
+
+    def tags_with_prefix(self, prefix):
+        """list of all local image names+tags starting with `prefix`"""
+        self.ensure()
+        with self.lock:
+            return [tag for tag in self.tags if tag.startswith(prefix)]
+
+    def process_event(self, event):
+        self.logger.debug("image event {action}: {image}".format(
+            action=event.get("Action"), image=event.get("id")))
+        self.invalidate()
+
+    def start(self):
+        self.watcher.start()
+
+    def stop(self):
+        self.watcher.stop()
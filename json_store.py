@@ -0,0 +1,86 @@
+#
+# Copyright 2017 Geoff Williams for Declarative Systems PTY LTD
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+import contextlib
+import fcntl
+import json
+import os
+
+
+class JsonStore:
+    """
+    JsonStore
+
+    A JSON file holding one document that is always read and written
+    whole.  Missing or corrupt files load as `default()` and saves go to a
+    temporary file that is then renamed over the old one, so a crash can't
+    leave a half written file.  Several pe_kit processes can share a file,
+    callers reload and save inside `locked()` so that none of them lose
+    another's changes.  Threads within a process do their own locking
+    """
+
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, path, description, default=dict):
+        self.path = path
+
+        # what's in the file, for log messages
+        self.description = description
+        self.default = default
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except IOError:
+            return self.default()
+        except ValueError as e:
+            self.logger.error("ignoring corrupt {description} {path}: {e}".format(
+                description=self.description, path=self.path, e=e))
+            return self.default()
+
+    @contextlib.contextmanager
+    def locked(self):
+        """
+        Hold an exclusive lock on a file next to ours for the block, shared
+        by every process using the store
+        """
+        f = None
+        try:
+            f = open(self.path + ".lock", "a")
+            fcntl.flock(f, fcntl.LOCK_EX)
+        except IOError as e:
+            self.logger.error("unable to lock {description} {path}, carrying on without: {e}".format(
+                description=self.description, path=self.path, e=e))
+        try:
+            yield
+        finally:
+            # closing releases the lock
+            if f:
+                f.close()
+
+    def save(self, data):
+        """write `data` to the file, returns True on success"""
+        tmp = self.path + ".tmp"
+        try:
+            with open(tmp, "w") as f:
+                json.dump(data, f)
+            os.rename(tmp, self.path)
+        except (IOError, OSError) as e:
+            self.logger.error("unable to save {description} {path}: {e}".format(
+                description=self.description, path=self.path, e=e))
+            return False
+        return True
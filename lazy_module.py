@@ -0,0 +1,52 @@
+#
+# Copyright 2017 Geoff Williams for Declarative Systems PTY LTD
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import importlib
+import threading
+
+
+class LazyModule:
+    """
+    LazyModule
+
+    Stand-in for a module that is only imported the first time one of its
+    attributes is used, so that heavy libraries (docker, requests...) don't
+    slow down startup.  Submodules we need are imported at the same time:
+
+        docker = LazyModule("docker", "docker.errors")
+        ...
+        except docker.errors.APIError:
+    """
+
+    # re-entrant so that loading a module whose import touches another lazy
+    # module on the same thread can't deadlock
+    lock = threading.RLock()
+
+    def __init__(self, name, *submodules):
+        self.__dict__["name"] = name
+        self.__dict__["submodules"] = submodules
+        self.__dict__["module"] = None
+
+    def load(self):
+        with self.lock:
+            if self.__dict__["module"] is None:
+                module = importlib.import_module(self.__dict__["name"])
+                for submodule in self.__dict__["submodules"]:
+                    importlib.import_module(submodule)
+                self.__dict__["module"] = module
+        return self.__dict__["module"]
+
+    def __getattr__(self, attr):
+        return getattr(self.__dict__["module"] or self.load(), attr)
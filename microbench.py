@@ -0,0 +1,213 @@
+#
+# Copyright 2017 Geoff Williams for Declarative Systems PTY LTD
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Micro-benchmarks of the Controller's hot paths against StubDockerDaemon
+# and StubDockerHub, so no docker, images or internet are needed:
+#
+#   python microbench.py                       run at 10, 100 and 1000 images
+#   python microbench.py --sizes 100 --iterations 200
+#   python microbench.py --output bench.json   save the results
+#   python microbench.py --baseline bench.json fail if any operation now
+#                                              makes more API calls
+#
+# Each operation reports its latency and the docker/hub API calls it
+# makes.  Call counts don't depend on the machine so those are what
+# `--baseline` checks, latency is only reported
+import logging
+logging.basicConfig(
+    level=logging.WARNING,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+import sys
+import os
+import argparse
+import tempfile
+import shutil
+import timeit
+import json
+from lazy_module import LazyModule
+from controller import Controller
+from notifier import LogNotifier
+from image_index import ImageIndex
+from hub_cache import HubTagCache
+from stub_docker_daemon import StubDockerDaemon
+from stub_docker_hub import StubDockerHub
+
+docker = LazyModule("docker")
+
+# non-class logger
+logger = logging.getLogger(__name__)
+
+SIZES = [10, 100, 1000]
+ITERATIONS = 50
+
+# mapped ports of the stub containers
+MASTER_PORTS = {"443/tcp": 32768, "9000/tcp": 32769, "8140/tcp": 8140}
+AGENT_PORTS = {"9090/tcp": 32770}
+
+
+def setup(workdir, size):
+    """A Controller talking to stubs loaded with `size` local images and hub tags"""
+    controller = Controller()
+    repos = [controller.container["master"]["image_name"], controller.container["agent"]["image_name"]]
+
+    daemon = StubDockerDaemon(
+        os.path.join(workdir, "docker.sock"),
+        images=StubDockerDaemon.image_list(repos + ["other/image"], size),
+        containers={
+            controller.container["master"]["name"]: {"image": repos[0] + ":latest", "ports": MASTER_PORTS},
+            controller.container["agent"]["name"]: {"image": repos[1] + ":latest", "ports": AGENT_PORTS},
+        })
+    daemon.start()
+
+    hub = StubDockerHub(dict((repo, StubDockerHub.tag_list(size)) for repo in repos))
+    hub.start()
+
+    # the parts of docker_connect() the hot paths need, without the
+    # background threads
+    controller.cli = docker.DockerClient(base_url="unix://" + daemon.path)
+    controller.ll_cli = docker.APIClient(base_url="unix://" + daemon.path)
+    controller.image_index = ImageIndex(controller.ll_cli)
+    controller.hub_cache = HubTagCache(os.path.join(workdir, "hub_cache.json"), 3600)
+    controller.hub = None
+    controller.notifier = LogNotifier()
+    controller.docker_url = "https://localhost"
+    controller.settings.hub_address = hub.address
+    controller.settings.hub_username = "bench"
+    controller.settings.hub_password = "bench"
+    for container_key in ["master", "agent"]:
+        controller.container[container_key]["instance"] = {"Id": controller.container[container_key]["name"]}
+
+    return controller, daemon, hub
+
+
+def operations(controller, repos):
+    """(name, function) of each operation to time"""
+    master = controller.container["master"]
+    agent = controller.container["agent"]
+    return [
+        ("docker_hub_image_tags", lambda: controller.docker_hub_image_tags(repos)),
+        ("refresh_images", controller.refresh_images),
+        ("update_local_images", lambda: controller.update_local_images(master)),
+        ("tag_exists_locally", lambda: controller.tag_exists_locally(repos[0] + ":2017.0.0")),
+        ("container_alive", lambda: controller.container_alive(master)),
+        ("munge_urls", lambda: controller.munge_urls(master)),
+        ("docker_exec", lambda: controller.docker_exec(agent, "true")),
+    ]
+
+
+def measure(func, iterations, stubs):
+    """(latencies in seconds, API calls per iteration by route) of calling `func`"""
+    latencies = []
+
+    # first call warms up connections, logins and caches like a real
+    # session would
+    func()
+    for stub in stubs:
+        stub.reset()
+
+    for i in range(iterations):
+        started = timeit.default_timer()
+        func()
+        latencies.append(timeit.default_timer() - started)
+
+    calls = {}
+    for stub in stubs:
+        for route, count in stub.reset().items():
+            calls[route] = float(count) / iterations
+    return latencies, calls
+
+
+def run(sizes, iterations):
+    """results as a list of dicts, one per operation and size"""
+    results = []
+    for size in sizes:
+        workdir = tempfile.mkdtemp(prefix="pe_kit_microbench")
+        controller, daemon, hub = setup(workdir, size)
+        try:
+            repos = [controller.container["master"]["image_name"], controller.container["agent"]["image_name"]]
+            for name, func in operations(controller, repos):
+                latencies, calls = measure(func, iterations, [daemon, hub])
+                latencies.sort()
+                results.append({
+                    "operation": name,
+                    "size": size,
+                    "iterations": iterations,
+                    "mean_ms": sum(latencies) / len(latencies) * 1000,
+                    "p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1000,
+                    "max_ms": latencies[-1] * 1000,
+                    "calls": calls,
+                    "calls_per_op": sum(calls.values()),
+                })
+        finally:
+            controller.ll_cli.close()
+            if controller.hub:
+                controller.hub.session.close()
+            daemon.stop()
+            hub.stop()
+            shutil.rmtree(workdir)
+    return results
+
+
+def report(results):
+    lines = ["{0:<24} {1:>6} {2:>10} {3:>10} {4:>10} {5:>8}  {6}".format(
+        "operation", "size", "mean", "p95", "max", "calls", "by route")]
+    for result in results:
+        lines.append("{0:<24} {1:>6} {2:>8.2f}ms {3:>8.2f}ms {4:>8.2f}ms {5:>8.2f}  {6}".format(
+            result["operation"], result["size"], result["mean_ms"], result["p95_ms"], result["max_ms"],
+            result["calls_per_op"],
+            ", ".join("{0} {1:.2f}".format(route, count) for route, count in sorted(result["calls"].items()))))
+    return "\n".join(lines)
+
+
+def regressions(results, baseline):
+    """operations making more API calls than they did in `baseline`"""
+    before = dict(((result["operation"], result["size"]), result["calls_per_op"]) for result in baseline)
+    return [
+        "{operation} at {size}: {calls:.2f} API calls per operation, was {before:.2f}".format(
+            operation=result["operation"], size=result["size"], calls=result["calls_per_op"],
+            before=before[(result["operation"], result["size"])])
+        for result in results
+        if (result["operation"], result["size"]) in before and
+        result["calls_per_op"] > before[(result["operation"], result["size"])] + 0.001]
+
+
+def main():
+    parser = argparse.ArgumentParser("PE_Kit - controller micro-benchmarks")
+    parser.add_argument("--sizes", default=",".join(str(size) for size in SIZES), help="comma separated numbers of local images and hub tags")
+    parser.add_argument("--iterations", type=int, default=ITERATIONS, help="times to call each operation")
+    parser.add_argument("--output", help="file to save the results to as json")
+    parser.add_argument("--baseline", help="results saved by --output to check API call counts against")
+    args = parser.parse_args()
+
+    results = run([int(size) for size in args.sizes.split(",")], args.iterations)
+    print(report(results))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            problems = regressions(results, json.load(f))
+        for problem in problems:
+            logger.error(problem)
+        if problems:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,34 @@
+#
+# Copyright 2017 Geoff Williams for Declarative Systems PTY LTD
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+
+
+class LogNotifier:
+    """
+    LogNotifier
+
+    Where the controller sends messages meant for the user when there is no
+    GUI to show them.  Anything with `error(message)` and `info(message)`
+    methods can be used instead - the GUI app plugs itself in to show popups
+    """
+
+    logger = logging.getLogger(__name__)
+
+    def error(self, message):
+        self.logger.error(message)
+
+    def info(self, message):
+        self.logger.info(message)
@@ -0,0 +1,228 @@
+#
+# Copyright 2017 Geoff Williams for Declarative Systems PTY LTD
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+import threading
+import time
+import os
+
+# inotify is linux only, without it we poll
+try:
+    import pyinotify
+except ImportError:
+    pyinotify = None
+
+
+class OnceoverSync:
+    """
+    OnceoverSync
+
+    Keep the production environment on the master in step with a control
+    repository configured with onceover.  The repository is scanned when
+    inotify says something changed (or every `POLL_INTERVAL` seconds if
+    we don't have inotify) and only files that were added, changed or removed
+    since the last scan are pushed.  The mapping is re-evaluated on every
+    scan so switching between the mock and real site.pp/hiera.yaml or
+    adding a new directory doesn't need a new container
+    """
+
+    logger = logging.getLogger(__name__)
+
+    # path in the environment -> paths in the control repo, first existing wins
+    MAPPING = [
+        ("modules", [".onceover/etc/puppetlabs/code/environments/production/modules"]),
+        ("manifests/site.pp", ["spec/site.pp", "manifests/site.pp"]),
+        ("hiera.yaml", ["spec/hiera.yaml", "hiera.yaml"]),
+        ("environment.conf", ["environment.conf"]),
+        ("scripts", ["scripts"]),
+        ("data", ["data"]),
+        ("site", ["site"]),
+    ]
+
+    # wait for things to settle after a change before scanning
+    SETTLE = 0.5
+
+    # without inotify every scan stats the whole module cache, so not too often
+    POLL_INTERVAL = 5
+
+    # directories that are never synced, nor worth watching or walking
+    SKIP_DIRS = [".git", ".onceover"]
+
+    def __init__(self, onceover_dir, upload_func, delete_func, changed_func=None, interval=1):
+        self.onceover_dir = os.path.abspath(onceover_dir)
+
+        # called with a list of (local path, environment path) to push,
+        # returns True on success
+        self.upload_func = upload_func
+
+        # called with a list of environment paths to remove, returns True on
+        # success
+        self.delete_func = delete_func
+
+        # called after each sync that changed something
+        self.changed_func = changed_func
+
+        self.interval = interval
+        self.running = True
+        self.dirty = threading.Event()
+        self.notifier = None
+
+        # environment path -> (mtime, size, local path) at the last sync,
+        # only touched by the sync thread
+        self.synced = {}
+
+        # set when an upload or delete failed, so we keep scanning until it
+        # goes through even if nothing else changes
+        self.retry = False
+
+        # set by resync() to have the sync thread send everything again
+        self.lock = threading.Lock()
+        self.full_sync = False
+
+    def snapshot(self):
+        """environment path -> (mtime, size, local path) of every file we would sync"""
+        files = {}
+        for remote, candidates in self.MAPPING:
+            for candidate in candidates:
+                local = os.path.join(self.onceover_dir, candidate)
+                if os.path.isfile(local):
+                    stat = os.stat(local)
+                    files[remote] = (stat.st_mtime, stat.st_size, local)
+                    break
+                elif os.path.isdir(local):
+                    for dirpath, dirnames, filenames in os.walk(local):
+                        dirnames[:] = [dirname for dirname in dirnames if dirname not in self.SKIP_DIRS]
+                        for filename in filenames:
+                            path = os.path.join(dirpath, filename)
+                            try:
+                                stat = os.stat(path)
+                            except OSError:
+                                # deleted while we were looking or a broken link
+                                continue
+                            files[os.path.join(remote, os.path.relpath(path, local))] = (
+                                stat.st_mtime, stat.st_size, path)
+                    break
+        return files
+
+    def sync(self):
+        """Push whatever changed since the last sync, returns True if anything did"""
+        started = time.time()
+        with self.lock:
+            if self.full_sync:
+                self.synced = {}
+                self.full_sync = False
+        files = self.snapshot()
+        changed = [
+            (files[remote][2], remote) for remote in sorted(files)
+            if self.synced.get(remote) != files[remote]]
+        removed = [remote for remote in sorted(self.synced) if remote not in files]
+
+        self.retry = False
+        synced = dict(files)
+        if changed and not self.upload_func(changed):
+            # keep the old entries so these files are sent again next time
+            self.logger.error("failed to upload {count} changed files, will retry".format(
+                count=len(changed)))
+            for local, remote in changed:
+                if remote in self.synced:
+                    synced[remote] = self.synced[remote]
+                else:
+                    del synced[remote]
+            changed = []
+            self.retry = True
+        if removed and not self.delete_func(removed):
+            self.logger.error("failed to remove {count} files, will retry".format(
+                count=len(removed)))
+            for remote in removed:
+                synced[remote] = self.synced[remote]
+            removed = []
+            self.retry = True
+        self.synced = synced
+
+        if changed or removed:
+            self.logger.info(
+                "synced {changed} changed and {removed} removed files from {onceover_dir} in {elapsed:.2f}s".format(
+                    changed=len(changed),
+                    removed=len(removed),
+                    onceover_dir=self.onceover_dir,
+                    elapsed=time.time() - started))
+        return bool(changed or removed)
+
+    def watch(self):
+        """Mark the repo dirty on any inotify event, returns False if we can't"""
+        if pyinotify is None:
+            return False
+        try:
+            watch_manager = pyinotify.WatchManager()
+            mask = (pyinotify.IN_CLOSE_WRITE | pyinotify.IN_CREATE | pyinotify.IN_DELETE |
+                    pyinotify.IN_MOVED_FROM | pyinotify.IN_MOVED_TO | pyinotify.IN_ATTRIB)
+            self.notifier = pyinotify.Notifier(
+                watch_manager, lambda event: self.dirty.set(), timeout=self.interval * 1000)
+            watch_manager.add_watch(
+                self.onceover_dir, mask, rec=True, auto_add=True,
+                exclude_filter=lambda path: os.path.basename(path) == ".git")
+        except Exception as e:
+            self.logger.error("inotify unavailable, polling for changes instead: " + str(e))
+            self.notifier = None
+            return False
+
+        threading.Thread(target=self.read_events).start()
+        return True
+
+    def read_events(self):
+        while self.running:
+            self.notifier.process_events()
+            if self.notifier.check_events():
+                self.notifier.read_events()
+        self.notifier.stop()
+
+    def run(self):
+        """daemon thread to sync when things change"""
+        inotify = self.watch()
+        self.logger.info("syncing {onceover_dir} using {method}".format(
+            onceover_dir=self.onceover_dir, method="inotify" if inotify else "polling"))
+
+        # everything is new the first time
+        self.dirty.set()
+        while self.running:
+            if inotify and not self.retry:
+                self.dirty.wait(self.interval)
+            else:
+                self.dirty.wait(self.POLL_INTERVAL)
+                self.dirty.set()
+
+            if self.dirty.is_set() and self.running:
+                time.sleep(self.SETTLE if inotify else 0)
+                self.dirty.clear()
+                try:
+                    if self.sync() and self.changed_func:
+                        self.changed_func()
+                except Exception as e:
+                    # try again from scratch next time
+                    self.logger.exception(e)
+                    self.synced = {}
+
+    def resync(self):
+        """Send everything again on the next sync, eg to a new master"""
+        with self.lock:
+            self.full_sync = True
+        self.dirty.set()
+
+    def start(self):
+        threading.Thread(target=self.run).start()
+
+    def stop(self):
+        self.running = False
+        self.dirty.set()
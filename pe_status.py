@@ -0,0 +1,239 @@
+#
+# Copyright 2017 Geoff Williams for Declarative Systems PTY LTD
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+import threading
+import time
+import ssl
+import socket
+import httplib
+from urlparse import urlparse
+from tracer import Tracer
+
+
+class PeStatusProber:
+    """
+    PeStatusProber
+
+    Background thread that polls the PE console over a single keep-alive
+    HTTPS connection and publishes the result as a snapshot.  Readers never
+    do any network I/O, they just look at the last snapshot
+    """
+
+    logger = logging.getLogger(__name__)
+
+    # seconds between probes once PE is running
+    RUNNING_INTERVAL = 5
+
+    # backoff between probes while PE is loading
+    MIN_BACKOFF = 0.5
+    MAX_BACKOFF = 8
+
+    # per-request timeout
+    TIMEOUT = 5
+
+    # redirects to follow (the console redirects to its login page)
+    MAX_REDIRECTS = 5
+
+    def __init__(self, url_func):
+        # callable returning the current console URL or None
+        self.url_func = url_func
+        self.connection = None
+        self.connection_netloc = None
+        self.backoff = self.MIN_BACKOFF
+        self.running = True
+        self.wake = threading.Event()
+
+        # set while PE is running so other threads can wait on it
+        self.ready = threading.Event()
+        self.lock = threading.Lock()
+        self.snapshot = self.unchecked()
+
+        # bumped by reset() so probes of the old master are thrown away
+        self.generation = 0
+        self.probed_generation = 0
+
+        # turn off SSL cert verifcation since we're using puppets self-signed certs
+        self.ctx = ssl.create_default_context()
+        self.ctx.check_hostname = False
+        self.ctx.verify_mode = ssl.CERT_NONE
+
+    @staticmethod
+    def unchecked():
+        return {
+            "status": "error",
+            "message": "not checked yet",
+            "latency": None,
+            "checked": None,
+        }
+
+    def get(self):
+        """Return a copy of the latest snapshot"""
+        with self.lock:
+            return dict(self.snapshot)
+
+    def status(self):
+        """return status of PE master: running, loading, error"""
+        return self.get()["status"]
+
+    def poke(self):
+        """Probe again right away, eg after (re)starting the master"""
+        self.backoff = self.MIN_BACKOFF
+        self.wake.set()
+
+    def reset(self):
+        """
+        Forget what we know about PE, eg when the master is replaced, and
+        probe again right away.  Safe to call from any thread, a probe in
+        progress is discarded rather than published
+        """
+        with self.lock:
+            self.generation += 1
+            self.snapshot = self.unchecked()
+            self.ready.clear()
+        self.poke()
+
+    def close(self):
+        if self.connection:
+            self.connection.close()
+        self.connection = None
+        self.connection_netloc = None
+
+    def connect(self, parsed):
+        self.close()
+        self.connection = httplib.HTTPSConnection(
+            parsed.hostname,
+            parsed.port or 443,
+            timeout=self.TIMEOUT,
+            context=self.ctx,
+        )
+        self.connection_netloc = parsed.netloc
+
+    def request(self, parsed):
+        """GET a URL on the persistent connection, returning (code, location)"""
+        path = parsed.path or "/"
+        if parsed.query:
+            path += "?" + parsed.query
+
+        if self.connection_netloc == parsed.netloc:
+            try:
+                self.connection.request("GET", path)
+                response = self.connection.getresponse()
+            except (httplib.HTTPException, socket.error):
+                # server closed the idle keep-alive connection, try once more
+                # on a fresh one
+                self.connect(parsed)
+                self.connection.request("GET", path)
+                response = self.connection.getresponse()
+        else:
+            self.connect(parsed)
+            self.connection.request("GET", path)
+            response = self.connection.getresponse()
+
+        # must read the whole body before the connection can be reused
+        response.read()
+        if response.getheader("connection", "").lower() == "close":
+            self.close()
+
+        return response.status, response.getheader("location")
+
+    def probe(self, url):
+        """Fetch the console, following redirects, return (status, message)"""
+        parsed = urlparse(url)
+        try:
+            redirects = 0
+            code, location = self.request(parsed)
+            while code in (301, 302, 303, 307) and location and redirects < self.MAX_REDIRECTS:
+                redirected = urlparse(location)
+                parsed = parsed._replace(path=redirected.path, query=redirected.query)
+                code, location = self.request(parsed)
+                redirects += 1
+
+            if code == 200:
+                message = "puppet up and running :D"
+                status = "running"
+            else:
+                message = "puppet http server error: code: {code}".format(code=code)
+                status = "loading"
+        except (httplib.HTTPException, socket.error, ssl.SSLError) as e:
+            self.close()
+            message = "puppet stopped/unreachable at {pe_url}:  {message}".format(
+                pe_url=url,
+                message=str(e),
+            )
+            status = "loading"
+
+        return status, message
+
+    def update(self):
+        """Run one probe and publish it.  Returns seconds until the next probe"""
+        with self.lock:
+            generation = self.generation
+        if generation != self.probed_generation:
+            # don't reuse a connection to the old master
+            self.close()
+            self.probed_generation = generation
+
+        url = self.url_func()
+        started = time.time()
+        if url:
+            with Tracer().span("probe " + url, "http"):
+                status, message = self.probe(url)
+        else:
+            self.close()
+            status = "error"
+            message = "error"
+        latency = time.time() - started
+
+        with self.lock:
+            if self.generation != generation:
+                # reset() while we were probing, this was the old master
+                return 0
+
+            if self.snapshot["status"] != status:
+                self.logger.debug("Status change: " + message)
+            self.snapshot = {
+                "status": status,
+                "message": message,
+                "latency": latency,
+                "checked": time.time(),
+            }
+            if status == "running":
+                self.ready.set()
+            else:
+                self.ready.clear()
+
+        if status == "loading":
+            delay = self.backoff
+            self.backoff = min(self.backoff * 2, self.MAX_BACKOFF)
+        else:
+            self.backoff = self.MIN_BACKOFF
+            delay = self.RUNNING_INTERVAL if status == "running" else self.MIN_BACKOFF * 2
+        return delay
+
+    def run(self):
+        """daemon thread to keep the snapshot up to date"""
+        while self.running:
+            delay = self.update()
+            self.wake.wait(delay)
+            self.wake.clear()
+        self.close()
+
+    def start(self):
+        threading.Thread(target=self.run).start()
+
+    def stop(self):
+        self.running = False
+        self.wake.set()
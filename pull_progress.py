@@ -0,0 +1,170 @@
+#
+# Copyright 2017 Geoff Williams for Declarative Systems PTY LTD
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+import time
+
+
+class PullCancelled(Exception):
+    """Raised inside a pull when the user cancels it or we are quitting"""
+    pass
+
+
+class PullError(Exception):
+    """Raised when the docker daemon reports an error in the pull stream"""
+
+    # daemon errors that retrying won't fix, eg "unauthorized: authentication
+    # required" or "manifest for x:y not found"
+    PERMANENT = ["unauthorized", "denied", "not found", "manifest unknown", "authentication required"]
+
+    def permanent(self):
+        message = str(self).lower()
+        return any(error in message for error in self.PERMANENT)
+
+
+class PullProgress:
+    """
+    PullProgress
+
+    Per-layer progress of a `docker pull`, built from the decoded pull
+    stream.  Layers that already exist locally or finished on a previous
+    attempt count as done, so progress carries across retries
+    """
+
+    # weight given to the newest throughput sample
+    SMOOTHING = 0.3
+
+    # statuses meaning a layer's data is all here
+    DONE_STATUSES = ["Download complete", "Extracting", "Pull complete", "Already exists"]
+
+    def __init__(self, image_name):
+        self.image_name = image_name
+        self.lock = threading.Lock()
+
+        # layer id -> {"status": str, "current": bytes, "total": bytes or None}
+        self.layers = {}
+        self.status = "starting"
+        self.attempt = 0
+        self.rate = 0.0
+        self.last_sample = None
+        self.finished = False
+
+    def feed(self, event):
+        """Update from one decoded event from the pull stream"""
+        if "error" in event:
+            raise PullError(event["error"])
+
+        layer_id = event.get("id")
+        status = event.get("status", "")
+        detail = event.get("progressDetail") or {}
+        with self.lock:
+            # events with an id are per-layer apart from the "Pulling from"
+            # banner, which carries the tag as its id
+            if layer_id and not status.startswith("Pulling from"):
+                layer = self.layers.setdefault(
+                    layer_id, {"status": status, "current": 0, "total": None})
+                layer["status"] = status
+                if status == "Downloading":
+                    layer["current"] = detail.get("current", layer["current"])
+                    layer["total"] = detail.get("total") or layer["total"]
+                elif status in self.DONE_STATUSES and layer["total"]:
+                    layer["current"] = layer["total"]
+            self.status = status
+        self.sample()
+
+    def sample(self):
+        """Update the smoothed throughput"""
+        now = time.time()
+        done = self.bytes_done()
+        with self.lock:
+            if self.last_sample:
+                last_time, last_done = self.last_sample
+                elapsed = now - last_time
+                if elapsed >= 0.5:
+                    rate = max(done - last_done, 0) / elapsed
+                    self.rate = self.SMOOTHING * rate + (1 - self.SMOOTHING) * self.rate
+                    self.last_sample = (now, done)
+            else:
+                self.last_sample = (now, done)
+
+    def bytes_done(self):
+        with self.lock:
+            return sum(layer["current"] for layer in self.layers.values() if layer["total"])
+
+    def bytes_total(self):
+        with self.lock:
+            return sum(layer["total"] for layer in self.layers.values() if layer["total"])
+
+    def layers_done(self):
+        with self.lock:
+            return len([
+                layer for layer in self.layers.values() if layer["status"] in self.DONE_STATUSES])
+
+    def unsized_layers(self):
+        """
+        (done, pending) counts of layers docker hasn't told us the size of.
+        It only reports sizes a few layers at a time, the rest are waiting
+        """
+        with self.lock:
+            unsized = [layer for layer in self.layers.values() if not layer["total"]]
+        done = len([layer for layer in unsized if layer["status"] in self.DONE_STATUSES])
+        return done, len(unsized) - done
+
+    def percent(self):
+        """
+        Percentage of layers complete, with partial credit by bytes for
+        those part way through.  Docker only reports sizes a few layers at a
+        time so a byte ratio runs ahead then drops back as more sizes come
+        in, whereas every layer is listed at the start of the pull
+        """
+        if self.finished:
+            return 100
+        unsized_done, unsized_pending = self.unsized_layers()
+        with self.lock:
+            layer_count = len(self.layers)
+            sized_done = sum(
+                float(layer["current"]) / layer["total"] for layer in self.layers.values() if layer["total"])
+        if layer_count:
+            percent = 100.0 * (sized_done + unsized_done) / layer_count
+        else:
+            percent = 0
+        return percent
+
+    def eta(self):
+        """
+        Estimated seconds remaining or None if we can't tell yet.  Layers
+        still waiting for a size are guessed at the mean size of the others
+        """
+        with self.lock:
+            sized_count = len([layer for layer in self.layers.values() if layer["total"]])
+        unsized_done, unsized_pending = self.unsized_layers()
+        total = self.bytes_total()
+        if self.rate > 0 and sized_count:
+            remaining = total - self.bytes_done() + unsized_pending * float(total) / sized_count
+            eta = remaining / self.rate
+        else:
+            eta = None
+        return eta
+
+    def summary(self):
+        """One line description for the GUI/logs"""
+        eta = self.eta()
+        return "{percent:.0f}% {done:.0f}/{total:.0f}MB {rate:.1f}MB/s ETA {eta}".format(
+            percent=self.percent(),
+            done=self.bytes_done() / 1e6,
+            total=self.bytes_total() / 1e6,
+            rate=self.rate / 1e6,
+            eta="{0}m{1:02d}s".format(int(eta) // 60, int(eta) % 60) if eta is not None else "-",
+        )
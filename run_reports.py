@@ -0,0 +1,115 @@
+#
+# Copyright 2017 Geoff Williams for Declarative Systems PTY LTD
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+import threading
+import json
+import csv
+from json_store import JsonStore
+
+
+class RunReports:
+    """
+    RunReports
+
+    History of puppet runs with the timings and resource counts puppet
+    writes to `last_run_summary.yaml`, persisted between runs so the
+    effect of control repo changes can be compared over time.  Only the
+    newest `max_reports` are kept
+    """
+
+    logger = logging.getLogger(__name__)
+
+    MAX_REPORTS = 200
+
+    # report fields in display/export order
+    FIELDS = [
+        "time", "container", "exit_code", "duration", "config_version",
+        "fact_generation", "plugin_sync", "config_retrieval", "catalog_application", "total",
+        "resources", "changed", "failed", "out_of_sync", "events_failed",
+    ]
+
+    def __init__(self, path, max_reports=MAX_REPORTS):
+        self.store = JsonStore(path, "run reports", list)
+        self.max_reports = max_reports
+        self.lock = threading.Lock()
+        self.reports = self.store.load()
+
+    @staticmethod
+    def from_summary(summary):
+        """Pick the interesting parts out of a parsed last_run_summary.yaml"""
+        times = summary.get("time") or {}
+        resources = summary.get("resources") or {}
+        events = summary.get("events") or {}
+        return {
+            "config_version": (summary.get("version") or {}).get("config"),
+
+            # config_retrieval includes compiling the catalog on the master
+            "fact_generation": times.get("fact_generation"),
+            "plugin_sync": times.get("plugin_sync"),
+            "config_retrieval": times.get("config_retrieval"),
+            "catalog_application": times.get("catalog_application"),
+            "total": times.get("total"),
+            "resources": resources.get("total"),
+            "changed": resources.get("changed"),
+            "failed": resources.get("failed"),
+            "out_of_sync": resources.get("out_of_sync"),
+            "events_failed": events.get("failure"),
+        }
+
+    @staticmethod
+    def summary(report):
+        """One line description of a report for the GUI/logs"""
+        def seconds(value):
+            return "{0:.1f}s".format(value) if value is not None else "-"
+
+        return ("compile {config_retrieval} apply {catalog_application} total {total}, "
+                "{resources} resources, {changed} changed, {failed} failed").format(
+            config_retrieval=seconds(report.get("config_retrieval")),
+            catalog_application=seconds(report.get("catalog_application")),
+            total=seconds(report.get("total")),
+            resources=report.get("resources", "?"),
+            changed=report.get("changed", "?"),
+            failed=report.get("failed", "?"),
+        )
+
+    def add(self, report):
+        with self.lock, self.store.locked():
+            self.reports = self.store.load()
+            self.reports.append(report)
+            del self.reports[:-self.max_reports]
+            self.store.save(self.reports)
+
+    def history(self, container_name=None):
+        """Reports oldest first, optionally only those for `container_name`"""
+        with self.lock:
+            return [
+                dict(report) for report in self.reports
+                if container_name is None or report.get("container") == container_name]
+
+    def latest(self, container_name):
+        """The newest report for `container_name` or None"""
+        history = self.history(container_name)
+        return history[-1] if history else None
+
+    def export(self, f, fmt="json", container_name=None):
+        """Write the history to the open file `f` as json or csv"""
+        history = self.history(container_name)
+        if fmt == "csv":
+            writer = csv.DictWriter(f, self.FIELDS, extrasaction="ignore")
+            writer.writeheader()
+            writer.writerows(history)
+        else:
+            json.dump(history, f, indent=2)
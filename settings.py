@@ -19,6 +19,12 @@ import ConfigParser
 class Settings:
     DEFAULTS_FILE           = os.path.dirname(os.path.realpath(__file__)) + "/defaults.cfg"
     CONFIG_FILE             = os.path.expanduser('~') + "/.pe_kit.cfg"
+    HUB_CACHE_FILE          = os.path.expanduser('~') + "/.pe_kit_hub_cache.json"
+    REPORTS_FILE            = os.path.expanduser('~') + "/.pe_kit_reports.json"
+    SNAPSHOTS_FILE          = os.path.expanduser('~') + "/.pe_kit_snapshots.json"
+    STACKS_FILE             = os.path.expanduser('~') + "/.pe_kit_stacks.json"
+    BENCHMARKS_FILE         = os.path.expanduser('~') + "/.pe_kit_benchmarks.json"
+    TRACE_FILE              = os.path.expanduser('~') + "/pe_kit_trace.json"
     __shared_state          = {}
     start_automatically     = True
     kill_orphans            = True
@@ -37,6 +43,12 @@ class Settings:
     hub_address             = None
     licence_file            = None
     shared_dir              = False
+    hub_cache_ttl           = 3600
+    max_concurrent_downloads = 1
+    agent_count             = 1
+    start_from_snapshot     = False
+    profile                 = "default"
+    pe_ready_timeout        = 1800
 
 
     def __init__(self):
@@ -86,6 +98,12 @@ class Settings:
         self.hub_password               = self.config.get("main", "hub_password")
         self.hub_address                = self.config.get("main", "hub_address")
         self.licence_file               = self.config.get("main", "licence_file")
+        self.hub_cache_ttl              = self.config.getint("main", "hub_cache_ttl")
+        self.max_concurrent_downloads   = self.config.getint("main", "max_concurrent_downloads")
+        self.agent_count                = max(self.config.getint("main", "agent_count"), 1)
+        self.start_from_snapshot        = self.config.getboolean("main", "start_from_snapshot")
+        self.profile                    = self.config.get("main", "profile")
+        self.pe_ready_timeout           = self.config.getint("main", "pe_ready_timeout")
 
         shared_dir_raw = self.config.get("main", "shared_dir")
         self.shared_dir = shared_dir_raw if shared_dir_raw.lower() != "false" else False
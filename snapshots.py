@@ -0,0 +1,51 @@
+#
+# Copyright 2017 Geoff Williams for Declarative Systems PTY LTD
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+import threading
+from json_store import JsonStore
+
+
+class Snapshots:
+    """
+    Snapshots
+
+    What we know about the images committed from booted containers: the
+    image each was originally started from (so a snapshot is only used
+    with the same image selected) and how long booting from scratch took
+    (so we can say how much time a fast start saved)
+    """
+
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, path):
+        self.store = JsonStore(path, "snapshot list")
+        self.lock = threading.Lock()
+
+        # snapshot key (the container key, prefixed by the stack name in
+        # named stacks) -> {"image", "source_image", "created", "boot_seconds"}
+        self.entries = self.store.load()
+
+    def get(self, key):
+        """snapshot details for `key` or None if we haven't taken one"""
+        with self.lock:
+            entry = self.entries.get(key)
+        return dict(entry) if entry else None
+
+    def put(self, key, entry):
+        with self.lock, self.store.locked():
+            self.entries = self.store.load()
+            self.entries[key] = entry
+            self.store.save(self.entries)
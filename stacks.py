@@ -0,0 +1,122 @@
+#
+# Copyright 2017 Geoff Williams for Declarative Systems PTY LTD
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+import threading
+import socket
+import errno
+import json
+import time
+from json_store import JsonStore
+
+
+class Stacks:
+    """
+    Stacks
+
+    Named master+agent stacks sharing a docker host and the host ports
+    handed out to each of them.  A stack keeps its ports until it is
+    removed so URLs and agents outside docker keep working across
+    restarts.  The ports themselves (8140...) are left for the default
+    stack, named stacks get the same port moved up in steps of `PORT_STEP`
+    """
+
+    logger = logging.getLogger(__name__)
+
+    PORT_STEP = 100
+    MAX_PORT = 65535
+
+    def __init__(self, path):
+        self.store = JsonStore(path, "stack list")
+        self.lock = threading.Lock()
+
+        # stack name -> {"created", "ports": {"container port": host port}}
+        self.entries = self.store.load()
+
+    def names(self):
+        with self.lock:
+            return sorted(self.entries)
+
+    def get(self, name):
+        """details of stack `name` or None if we don't know it"""
+        with self.lock:
+            entry = self.entries.get(name)
+        return json.loads(json.dumps(entry)) if entry else None
+
+    def remove(self, name):
+        """forget stack `name` and release its ports"""
+        with self.lock, self.store.locked():
+            self.entries = self.store.load()
+            if self.entries.pop(name, None) is not None:
+                self.store.save(self.entries)
+
+    @staticmethod
+    def port_free(port):
+        """True if nothing on this host is listening on `port`"""
+        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            s.bind(("0.0.0.0", port))
+        except socket.error as e:
+            if e.errno in (errno.EADDRINUSE, errno.EACCES):
+                return False
+            raise
+        finally:
+            s.close()
+        return True
+
+    def free_port(self, port, taken):
+        for candidate in range(port + self.PORT_STEP, self.MAX_PORT + 1, self.PORT_STEP):
+            if candidate not in taken and self.port_free(candidate):
+                return candidate
+
+        # let the kernel pick one
+        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            s.bind(("0.0.0.0", 0))
+            return s.getsockname()[1]
+        finally:
+            s.close()
+
+    def allocate(self, name, ports, in_use=()):
+        """
+        container port -> host port for each of `ports` in stack `name`,
+        reusing the ports it had before.  New ports avoid those held by
+        other stacks, `in_use` and anything else listening on the host
+        """
+        with self.lock, self.store.locked():
+            # another pe_kit may have taken ports since we last looked
+            self.entries = self.store.load()
+            stack = self.entries.setdefault(name, {"created": time.time(), "ports": {}})
+            taken = set(in_use)
+            for other in self.entries:
+                if other != name:
+                    taken.update(self.entries[other]["ports"].values())
+
+            allocated = {}
+            changed = False
+            for port in ports:
+                host_port = stack["ports"].get(str(port))
+                if host_port is None:
+                    host_port = self.free_port(port, taken)
+                    stack["ports"][str(port)] = host_port
+                    changed = True
+                    self.logger.info("stack {name} port {port} is {host_port} on this host".format(
+                        name=name, port=port, host_port=host_port))
+                taken.add(host_port)
+                allocated[port] = host_port
+
+            if changed:
+                self.store.save(self.entries)
+        return allocated
@@ -0,0 +1,57 @@
+#
+# Copyright 2017 Geoff Williams for Declarative Systems PTY LTD
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+import threading
+import time
+
+
+class StartupTimeline:
+    """
+    StartupTimeline
+
+    Seconds from process start to each startup milestone (imports done,
+    GUI built, first frame drawn, docker connected...), logged as they
+    happen so that slow starts show up in the log
+    """
+
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, started=None):
+        self.started = started or time.time()
+        self.lock = threading.Lock()
+
+        # [(milestone, seconds since start), ...] in the order they happened
+        self.marks = []
+
+    def mark(self, milestone):
+        now = time.time() - self.started
+        with self.lock:
+            previous = self.marks[-1][1] if self.marks else 0
+            self.marks.append((milestone, now))
+        self.logger.info("startup: {milestone} at {now:.2f}s (+{delta:.2f}s)".format(
+            milestone=milestone, now=now, delta=now - previous))
+
+    def timings(self):
+        """dict of milestone -> seconds since start"""
+        with self.lock:
+            return dict(self.marks)
+
+    def report(self):
+        """one line summary of the whole timeline"""
+        with self.lock:
+            return ", ".join(
+                "{milestone} {now:.2f}s".format(milestone=milestone, now=now)
+                for milestone, now in self.marks)
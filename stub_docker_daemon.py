@@ -0,0 +1,203 @@
+#
+# Copyright 2017 Geoff Williams for Declarative Systems PTY LTD
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+import threading
+import SocketServer
+import BaseHTTPServer
+import itertools
+import struct
+import json
+import re
+import os
+from collections import Counter
+
+
+class StubDockerDaemon:
+    """
+    StubDockerDaemon
+
+    Just enough of the Docker Engine API, served over a unix socket, to
+    drive the Controller without docker or any images.  The daemon knows
+    the images and containers it was given and counts every request by
+    route so callers can see how many round trips an operation took
+    """
+
+    logger = logging.getLogger(__name__)
+
+    # docker-py puts the API version in front of every path
+    VERSION_PREFIX = re.compile(r"^/v[0-9.]+")
+
+    # output of every exec, one docker stdout frame per line
+    EXEC_OUTPUT = ["Notice: Applied catalog in 0.01 seconds"]
+
+    def __init__(self, path, images=None, containers=None):
+        self.path = path
+
+        # [{"Id", "RepoTags"}, ...] as returned by `docker images`
+        self.images = images or []
+
+        # container name -> {"image", "ports": {"443/tcp": host port}}
+        self.containers = containers or {}
+
+        self.calls = Counter()
+        self.lock = threading.Lock()
+        self.exec_ids = itertools.count(1)
+        self.server = None
+
+    @staticmethod
+    def image_list(repos, count):
+        """`count` images spread over `repos`, tagged like the PE images"""
+        return [
+            {
+                "Id": "sha256:{0:064x}".format(number),
+                "RepoTags": ["{repo}:2017.{minor}.{patch}".format(
+                    repo=repos[number % len(repos)], minor=number // 100, patch=number % 100)],
+            }
+            for number in range(count)]
+
+    def count(self, route):
+        with self.lock:
+            self.calls[route] += 1
+
+    def reset(self):
+        """forget the calls so far, returns what they were"""
+        with self.lock:
+            calls = dict(self.calls)
+            self.calls.clear()
+        return calls
+
+    def inspect(self, name):
+        container = self.containers[name]
+        return {
+            "Id": name,
+            "Name": "/" + name,
+            "Config": {"Image": container["image"]},
+            "State": {
+                "Status": "running",
+                "Running": True,
+                "StartedAt": "2017-01-01T00:00:00.000000000Z",
+            },
+            "NetworkSettings": {
+                "Ports": dict(
+                    (port, [{"HostIp": "0.0.0.0", "HostPort": str(host_port)}])
+                    for port, host_port in container["ports"].items()),
+                "Networks": {"pe_kit": {"Aliases": [name]}},
+            },
+        }
+
+    def handle(self, method, path):
+        """
+        (status, body, stream) for one request.  The body is sent as json
+        unless `stream` is set, then it is lines of exec output
+        """
+        path = self.VERSION_PREFIX.sub("", path.split("?")[0])
+        match = re.match(r"^/containers/([^/]+)/(json|exec)$", path)
+        if path == "/_ping":
+            self.count(method + " /_ping")
+            return 200, "OK", False
+        elif path == "/version":
+            self.count(method + " /version")
+            return 200, {"ApiVersion": "1.26", "Version": "stub"}, False
+        elif path == "/images/json":
+            self.count(method + " /images/json")
+            return 200, self.images, False
+        elif path == "/containers/json":
+            self.count(method + " /containers/json")
+            return 200, [
+                {"Id": name, "Names": ["/" + name], "Ports": [
+                    {"PrivatePort": int(port.split("/")[0]), "PublicPort": host_port, "Type": "tcp"}
+                    for port, host_port in self.containers[name]["ports"].items()]}
+                for name in self.containers], False
+        elif match:
+            self.count("{method} /containers/{{name}}/{action}".format(method=method, action=match.group(2)))
+            if match.group(1) not in self.containers:
+                return 404, {"message": "No such container: " + match.group(1)}, False
+            if match.group(2) == "json":
+                return 200, self.inspect(match.group(1)), False
+            return 201, {"Id": "exec{0}".format(next(self.exec_ids))}, False
+        elif re.match(r"^/exec/[^/]+/start$", path):
+            self.count(method + " /exec/{id}/start")
+            return 200, self.EXEC_OUTPUT, True
+        elif re.match(r"^/exec/[^/]+/json$", path):
+            self.count(method + " /exec/{id}/json")
+            return 200, {"ExitCode": 0, "Running": False}, False
+
+        self.count(method + " unknown")
+        return 404, {"message": "page not found"}, False
+
+    def start(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self.server = UnixHTTPServer(self.path, StubDockerHandler)
+        self.server.stub = self
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+class UnixHTTPServer(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+    daemon_threads = True
+
+
+class StubDockerHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """HTTP/1.1 with keep-alive like the real daemon, so connection reuse is measured too"""
+
+    protocol_version = "HTTP/1.1"
+
+    # one write per response, unbuffered headers get held up by nagle
+    wbufsize = -1
+
+    def address_string(self):
+        # unix sockets have no client address
+        return "unix"
+
+    def log_message(self, format, *args):
+        StubDockerDaemon.logger.debug(format % args)
+
+    def reply(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            self.rfile.read(length)
+
+        status, body, stream = self.server.stub.handle(self.command, self.path)
+        self.send_response(status)
+        if stream:
+            # exec output is a raw stream of frames on a connection that
+            # is then closed, not an HTTP body
+            self.send_header("Content-Type", "application/vnd.docker.raw-stream")
+            self.end_headers()
+            for line in body:
+                data = line + "\n"
+                self.wfile.write(struct.pack(">BxxxL", 1, len(data)) + data)
+            self.close_connection = True
+            return
+
+        data = body if isinstance(body, str) else json.dumps(body)
+        self.send_header("Content-Type", "application/json" if data is not body else "text/plain")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    do_GET = reply
+    do_POST = reply
+    do_DELETE = reply
@@ -0,0 +1,159 @@
+#
+# Copyright 2017 Geoff Williams for Declarative Systems PTY LTD
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+import threading
+import SocketServer
+import BaseHTTPServer
+import base64
+import hashlib
+import json
+import time
+import re
+from urlparse import urlparse, parse_qs
+from collections import Counter
+
+
+class StubDockerHub:
+    """
+    StubDockerHub
+
+    The parts of the Docker Hub API that DockerHubClient uses - login and
+    paginated tag listings with ETags - served on localhost from the tags
+    it was given.  Every request is counted by route
+    """
+
+    logger = logging.getLogger(__name__)
+
+    # seconds tokens are valid for
+    TOKEN_TTL = 3600
+
+    def __init__(self, tags=None):
+        # repo -> [tag name, ...]
+        self.tags = tags or {}
+        self.calls = Counter()
+        self.lock = threading.Lock()
+        self.server = None
+
+    @staticmethod
+    def tag_list(count):
+        """`count` tag names like the PE images have"""
+        return ["2017.{minor}.{patch}".format(minor=number // 100, patch=number % 100) for number in range(count)]
+
+    @property
+    def address(self):
+        return "http://127.0.0.1:{port}".format(port=self.server.server_address[1])
+
+    def count(self, route):
+        with self.lock:
+            self.calls[route] += 1
+
+    def reset(self):
+        """forget the calls so far, returns what they were"""
+        with self.lock:
+            calls = dict(self.calls)
+            self.calls.clear()
+        return calls
+
+    def token(self):
+        """an unsigned JWT that DockerHubClient can read the expiry from"""
+        def encode(data):
+            return base64.urlsafe_b64encode(json.dumps(data)).rstrip("=")
+        return ".".join([
+            encode({"alg": "none"}),
+            encode({"exp": int(time.time()) + self.TOKEN_TTL}),
+            "stub"])
+
+    def page(self, repo, page, page_size):
+        tags = self.tags.get(repo, [])
+        start = (page - 1) * page_size
+        more = start + page_size < len(tags)
+        return {
+            "count": len(tags),
+            "next": "{address}/v2/repositories/{repo}/tags/?page_size={page_size}&page={page}".format(
+                address=self.address, repo=repo, page_size=page_size, page=page + 1) if more else None,
+            "results": [{"name": tag} for tag in tags[start:start + page_size]],
+        }
+
+    def handle(self, method, path, headers):
+        """(status, extra headers, body) for one request"""
+        parsed = urlparse(path)
+        query = parse_qs(parsed.query)
+        match = re.match(r"^/v2/repositories/(.+)/tags/$", parsed.path)
+        if method == "POST" and parsed.path == "/v2/users/login/":
+            self.count("POST /v2/users/login/")
+            return 200, {}, {"token": self.token()}
+        elif method == "GET" and match:
+            self.count("GET /v2/repositories/{repo}/tags/")
+            if not headers.get("Authorization", "").startswith("JWT "):
+                return 401, {}, {"detail": "Authentication credentials were not provided."}
+
+            page = self.page(
+                match.group(1),
+                int(query.get("page", ["1"])[0]),
+                int(query.get("page_size", ["10"])[0]))
+            body = json.dumps(page)
+            etag = '"{0}"'.format(hashlib.md5(body).hexdigest())
+            if headers.get("If-None-Match") == etag:
+                return 304, {"ETag": etag}, None
+            return 200, {"ETag": etag}, page
+
+        self.count(method + " unknown")
+        return 404, {}, {"detail": "Not found"}
+
+    def start(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), StubDockerHubHandler)
+        self.server.stub = self
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+
+
+class ThreadingHTTPServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+class StubDockerHubHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    protocol_version = "HTTP/1.1"
+
+    # one write per response, unbuffered headers get held up by nagle
+    wbufsize = -1
+
+    def log_message(self, format, *args):
+        StubDockerHub.logger.debug(format % args)
+
+    def reply(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            self.rfile.read(length)
+
+        status, headers, body = self.server.stub.handle(self.command, self.path, self.headers)
+        data = json.dumps(body) if body is not None else ""
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    do_GET = reply
+    do_POST = reply
@@ -0,0 +1,108 @@
+#
+# Copyright 2017 Geoff Williams for Declarative Systems PTY LTD
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import stat
+import tarfile
+import time
+
+
+class TarStream:
+    """
+    TarStream
+
+    Tar archive of local files and directories produced a chunk at a time,
+    so that uploads to containers (docker only takes tarballs) don't need
+    a temporary file and large trees are never held in memory.  Each entry
+    is a (local path, name in archive) pair so files can be renamed on the
+    way.  Generated files can be added as (name in archive, bytes) pairs
+    in `contents`.  Everything in the archive is owned by root
+    """
+
+    # bytes to read from a file at a time
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, entries, contents=None):
+        self.entries = entries
+        self.contents = contents or []
+
+    def walk(self, local_path, arcname):
+        """(local path, name in archive) for `local_path` and everything under it"""
+        yield local_path, arcname
+        if os.path.isdir(local_path) and not os.path.islink(local_path):
+            for dirpath, dirnames, filenames in os.walk(local_path):
+                dirnames.sort()
+                for name in dirnames + sorted(filenames):
+                    path = os.path.join(dirpath, name)
+                    yield path, os.path.join(arcname, os.path.relpath(path, local_path))
+
+    @staticmethod
+    def tarinfo(path, arcname):
+        info = os.lstat(path)
+        tarinfo = tarfile.TarInfo(arcname)
+        tarinfo.mode = stat.S_IMODE(info.st_mode)
+        tarinfo.mtime = info.st_mtime
+        tarinfo.uid = tarinfo.gid = 0
+        tarinfo.uname = tarinfo.gname = "root"
+        if stat.S_ISDIR(info.st_mode):
+            tarinfo.type = tarfile.DIRTYPE
+        elif stat.S_ISLNK(info.st_mode):
+            tarinfo.type = tarfile.SYMTYPE
+            tarinfo.linkname = os.readlink(path)
+        else:
+            tarinfo.type = tarfile.REGTYPE
+            tarinfo.size = info.st_size
+        return tarinfo
+
+    def chunks(self):
+        """Generator of the archive as byte strings"""
+        for local_path, arcname in self.entries:
+            for path, name in self.walk(local_path, arcname):
+                tarinfo = self.tarinfo(path, name)
+                yield tarinfo.tobuf(tarfile.GNU_FORMAT)
+                if tarinfo.isreg():
+                    remaining = tarinfo.size
+                    with open(path, "rb") as f:
+                        # don't send more than the header promised if the
+                        # file grows while we read it
+                        while remaining > 0:
+                            chunk = f.read(min(self.CHUNK_SIZE, remaining))
+                            if not chunk:
+                                break
+                            remaining -= len(chunk)
+                            yield chunk
+
+                    # or pad it out if it shrank
+                    padding = remaining + (-tarinfo.size % tarfile.BLOCKSIZE)
+                    if padding:
+                        yield tarfile.NUL * padding
+
+        for arcname, data in self.contents:
+            tarinfo = tarfile.TarInfo(arcname)
+            tarinfo.size = len(data)
+            tarinfo.mode = 0o644
+            tarinfo.mtime = time.time()
+            tarinfo.uname = tarinfo.gname = "root"
+            yield tarinfo.tobuf(tarfile.GNU_FORMAT)
+            yield data
+            if -len(data) % tarfile.BLOCKSIZE:
+                yield tarfile.NUL * (-len(data) % tarfile.BLOCKSIZE)
+
+        # end of archive
+        yield tarfile.NUL * (tarfile.BLOCKSIZE * 2)
+
+    def getvalue(self):
+        """The whole archive as one byte string, for small uploads"""
+        return b"".join(self.chunks())
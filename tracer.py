@@ -0,0 +1,135 @@
+#
+# Copyright 2017 Geoff Williams for Declarative Systems PTY LTD
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+import threading
+import functools
+import contextlib
+import json
+import time
+import os
+import re
+from collections import deque
+
+
+# borg class, see http://code.activestate.com/recipes/66531-singleton-we-dont-need-no-stinkin-singleton-the-bo/
+class Tracer:
+    """
+    Tracer
+
+    Spans for what the controller is doing - the start, duration, thread
+    and outcome of each operation and each docker/hub request - kept in
+    memory as the last `MAX_SPANS` and exported as Chrome trace event JSON
+    (load it in chrome://tracing or https://ui.perfetto.dev) to see which
+    threads overlap and what blocks what
+    """
+    __shared_state = {}
+
+    logger = logging.getLogger(__name__)
+
+    MAX_SPANS = 20000
+
+    # docker-py puts the API version in front of every path
+    VERSION_PREFIX = re.compile(r"^/v1\.[0-9]+")
+
+    enabled = True
+    lock = threading.Lock()
+    spans = deque(maxlen=MAX_SPANS)
+
+    # thread id -> name, for labelling the rows of the trace
+    threads = {}
+
+    def __init__(self):
+        self.__dict__ = self.__shared_state
+
+    def record(self, name, category, started, duration, outcome, args=None):
+        thread = threading.current_thread()
+        span = {
+            "name": name,
+            "cat": category,
+            "ph": "X",
+            "ts": int(started * 1000000),
+            "dur": int(duration * 1000000),
+            "pid": os.getpid(),
+            "tid": thread.ident,
+            "args": dict(args or {}, outcome=outcome),
+        }
+        with self.lock:
+            self.spans.append(span)
+            self.threads[thread.ident] = thread.name
+
+    @contextlib.contextmanager
+    def span(self, name, category="controller", **args):
+        """record the block as a span called `name`"""
+        if not self.enabled:
+            yield
+            return
+
+        started = time.time()
+        outcome = "ok"
+        try:
+            yield
+        except BaseException as e:
+            outcome = "{kind}: {error}".format(kind=type(e).__name__, error=e)
+            raise
+        finally:
+            self.record(name, category, started, time.time() - started, outcome, args)
+
+    @staticmethod
+    def traced(func):
+        """decorator recording each call to `func` as a span"""
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with Tracer().span(func.__name__):
+                return func(*args, **kwargs)
+        return wrapper
+
+    def trace_session(self, session, category):
+        """
+        record every request made through the requests `session` (docker-py
+        clients are sessions too).  Streamed responses are timed up to their
+        headers
+        """
+        send = session.send
+
+        def traced_send(request, **kwargs):
+            path = self.VERSION_PREFIX.sub("", request.path_url.split("?")[0])
+            with self.span(request.method + " " + path, category):
+                return send(request, **kwargs)
+        session.send = traced_send
+        return session
+
+    def clear(self):
+        with self.lock:
+            self.spans.clear()
+
+    def events(self):
+        """the spans as a Chrome trace, oldest first"""
+        with self.lock:
+            spans = list(self.spans)
+            threads = dict(self.threads)
+        metadata = [
+            {"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": ident, "args": {"name": name}}
+            for ident, name in threads.items()]
+        return {"traceEvents": metadata + spans, "displayTimeUnit": "ms"}
+
+    def export(self, path):
+        """write the trace to `path`, returns the number of spans written"""
+        trace = self.events()
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(trace, f)
+        os.rename(tmp, path)
+        return len([event for event in trace["traceEvents"] if event["ph"] == "X"])
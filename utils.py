@@ -16,10 +16,14 @@
 import platform
 import subprocess
 import os
+import time
+import logging
 from settings import Settings
 
 class Utils:
 
+    logger = logging.getLogger(__name__)
+
     @staticmethod
     def docker_terminal(command=''):
         settings = Settings()
@@ -48,4 +52,45 @@ class Utils:
                 found = files[i]
             i += 1
 
-        return found
\ No newline at end of file
+        return found
+
+    @staticmethod
+    def wait_for(condition, timeout, interval=1, description="condition", running=None):
+        """
+        Poll `condition` every `interval` seconds until it returns true, `timeout`
+        seconds have passed (`None` waits forever) or `running` returns false.
+        Returns a tuple of the last result of `condition` and the seconds waited
+        """
+        started = time.time()
+        result = condition()
+        while not result and (running is None or running()):
+            remaining = None if timeout is None else started + timeout - time.time()
+            if remaining is not None and remaining <= 0:
+                break
+            time.sleep(interval if remaining is None else min(interval, remaining))
+            result = condition()
+
+        waited = time.time() - started
+        Utils.logger.info("waited {waited:.1f}s for {description}: {result}".format(
+            waited=waited, description=description, result="ok" if result else "gave up"))
+        return result, waited
+
+    @staticmethod
+    def wait_event(event, timeout=None, interval=1, description="event", running=None):
+        """
+        Wait for a `threading.Event` to be set, waking every `interval` seconds
+        to check `running` so that we notice when we're shutting down.  Returns
+        a tuple of whether the event was set and the seconds waited
+        """
+        started = time.time()
+        result = event.is_set()
+        while not result and (running is None or running()):
+            remaining = None if timeout is None else started + timeout - time.time()
+            if remaining is not None and remaining <= 0:
+                break
+            result = event.wait(interval if remaining is None else min(interval, remaining))
+
+        waited = time.time() - started
+        Utils.logger.info("waited {waited:.1f}s for {description}: {result}".format(
+            waited=waited, description=description, result="ok" if result else "gave up"))
+        return result, waited